@@ -1,21 +1,56 @@
-__all__ = ['plot', 'readin', 'spectral']
+__all__ = ['epoch', 'filters', 'memo', 'moving', 'pipeline', 'plot', 'precision', 'readin', 'recording', 'spectral']
 
-from biosig.plot import \
-    set_details, save_plot, \
-    plot_raw, plot_filt, plot_powerspec
+from biosig.readin import \
+    read_data, iter_data, read_array, iter_array, \
+    evict_cache, clear_cache, \
+    make_time, read_log, calibrate, \
+    ContainerWriter, ContainerReader, write_container, read_container, convert_text, \
+    encode_frame, decode_frame, AcquisitionStream, start_simulator, simulate_udp
 
-from biosig.readin import read_data, make_time, read_log, calibrate
+from biosig.precision import set_dtype, get_dtype
 
-from biosig.spectral import find_index_fband, calc_percentpower, find_index_digital
+from biosig.recording import Recording, accepts_recording
+
+from biosig.filters import design_butter, ChunkedFilter, filter_into
+
+from biosig.moving import range_sum, moving_sum, moving_mean, moving_rms
+
+from biosig.spectral import \
+    find_index_fband, calc_percentpower, find_index_fbands, calc_bandpower, \
+    find_index_digital, find_pulses, \
+    calc_stft, calc_median_frequency, calc_mean_frequency, calc_fatigue, \
+    iter_stft, reduce_spectrogram, calc_spectrogram
 
 from biosig.emg import process
 
 from biosig.emg.process import \
-    remove_mean, filter_bandpass, rectify, \
-    calc_halfwidth, find_mvc, calc_mvc, \
-    calc_rms, calc_mean
+    remove_mean, filter_bandpass, filter_bandpass_chunks, rectify, \
+    calc_halfwidth, find_mvc, find_mvc_window, calc_mvc, \
+    calc_rms, calc_mean, calc_tkeo, find_bursts
+
+from biosig.emg.online import EnvelopeProcessor, benchmark_envelope
 
 from biosig.force import process
 
-from biosig.force.process import filter_lowpass, calc_var
+from biosig.force.process import filter_lowpass, filter_lowpass_chunks, resample, resample_channels, calc_var, \
+    calc_var_rolling, calc_var_segments, RollingVar, calc_slope_rolling, find_plateaus
+
+from biosig.epoch import calc_epoch_width, make_epochs, reduce_epochs, average_epochs
+
+from biosig.memo import enable_memo, disable_memo, memo_stats, clear_memo, evict_memo
+
+from biosig.pipeline import Stage, Ref, Format, stage, run_trial, run_pipeline, write_results
+
+
+# biosig.plot imports matplotlib, which is slow and may need a display backend,
+# so it is only imported when the module or one of its functions is first used.
+_PLOT_FUNCTIONS = ('set_details', 'new_figure', 'save_plot', 'decimate_minmax', 'plot_trace',
+                   'plot_raw', 'plot_filt', 'plot_powerspec', 'plot_spectrogram', 'plot_batch')
+
 
+def __getattr__(name):
+    if name == 'plot' or name in _PLOT_FUNCTIONS:
+        import importlib
+        plot = importlib.import_module('biosig.plot')
+        return plot if name == 'plot' else getattr(plot, name)
+    raise AttributeError("module 'biosig' has no attribute {!r}".format(name))
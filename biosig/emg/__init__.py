@@ -1,9 +1,12 @@
-__all__ = ['process']
+__all__ = ['online', 'process']
 
 from biosig.emg import process
 
 from biosig.emg.process import \
-    remove_mean, filter_bandpass, rectify, \
-    calc_halfwidth, find_mvc, calc_mvc, \
-    calc_rms, calc_mean
+    remove_mean, filter_bandpass, filter_bandpass_chunks, rectify, \
+    calc_halfwidth, find_mvc, find_mvc_window, calc_mvc, \
+    calc_rms, calc_mean, calc_tkeo, find_bursts
 
+from biosig.emg import online
+
+from biosig.emg.online import EnvelopeProcessor, benchmark_envelope
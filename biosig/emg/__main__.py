@@ -0,0 +1,8 @@
+from biosig.emg.online import benchmark_envelope
+
+
+# Latency and throughput of online EMG processing: python -m biosig.emg
+for block_ms in (1, 10, 50):
+    stats = benchmark_envelope(block_ms=block_ms)
+    print('2 kHz x 16 channels, {} ms blocks: '.format(block_ms) +
+          ', '.join('{} {:.4g}'.format(k, v) for k, v in stats.items()))
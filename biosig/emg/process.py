@@ -1,21 +1,38 @@
 import numpy as np
 from scipy import signal
-import matplotlib.pyplot as plt
 
+from biosig.filters import design_butter, ChunkedFilter, filter_into
+from biosig.memo import memoize
+from biosig.recording import accepts_recording
+from biosig.precision import result_dtype, prepare_out
+from biosig.moving import range_sum, moving_mean, moving_rms
+from biosig.spectral import find_pulses
 
-def remove_mean(data, plot=False):
+
+@accepts_recording
+def remove_mean(data, axis=0, plot=False, dtype=None, out=None):
     """
     Remove the mean from a recorded signal.
+    Multi-channel data (eg. samples x channels) have the mean of each channel removed.
+    The mean is calculated in float64 for any data type.
 
     :param data: data
     :type data: ndarray
+    :param axis: axis of samples
+    :type axis: int
     :param plot: show plot of original and mean-removed data
     :type plot: bool
+    :param dtype: data type of result, see set_dtype
+    :type dtype: dtype
+    :param out: array to write result to, can be data to process in place
+    :type out: ndarray
     :return: data with mean removed
     :rtype: ndarray
     """
-    data_removedmean = data - np.mean(data)
+    mean = np.mean(data, axis=axis, keepdims=True, dtype=np.float64)
+    data_removedmean = np.subtract(data, mean, out=prepare_out(data, dtype, out), casting='same_kind')
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data, label='original')
@@ -27,9 +44,15 @@ def remove_mean(data, plot=False):
     return data_removedmean
 
 
-def filter_bandpass(data, freq, highpass=30, lowpass=500, plot=False):
+@accepts_recording
+@memoize
+def filter_bandpass(data, freq, highpass=30, lowpass=500, axis=0, plot=False, dtype=None, out=None):
     """
     Apply bandpass filter to a recorded signal (usually EMG).
+    A 4th-order Butterworth filter is applied forward and backward as second-order sections.
+    Multi-channel data (eg. samples x channels) are filtered along the nominated axis in one call.
+    If out is given or the result is not float64, the signal is filtered in blocks into the result
+    (see filter_into), so no full-length float64 copies are made.
 
     :param data: data
     :type data: ndarray
@@ -39,16 +62,24 @@ def filter_bandpass(data, freq, highpass=30, lowpass=500, plot=False):
     :type highpass: int
     :param lowpass: low pass cut-off (Hz)
     :type lowpass: int
+    :param axis: axis of samples
+    :type axis: int
     :param plot: show plot of original and filtered data
     :type plot: bool
+    :param dtype: data type of result, see set_dtype
+    :type dtype: dtype
+    :param out: array to write result to, can be data to process in place
+    :type out: ndarray
     :return: filtered data
     :rtype: ndarray
     """
-    freq_nyq = freq/2
-    high, low = highpass/freq_nyq, lowpass/freq_nyq
-    b, a = signal.butter(4, [high, low], btype='bandpass')
-    data_filt = signal.filtfilt(b, a, data)
+    sos = design_butter(4, freq, (highpass, lowpass), 'bandpass')
+    if out is None and result_dtype(data, dtype) == np.float64:
+        data_filt = signal.sosfiltfilt(sos, data, axis=axis)
+    else:
+        data_filt = filter_into(sos, data, prepare_out(data, dtype, out), axis=axis)
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data, label='original')
@@ -60,7 +91,42 @@ def filter_bandpass(data, freq, highpass=30, lowpass=500, plot=False):
     return data_filt
 
 
-def rectify(data, plot=False):
+def filter_bandpass_chunks(chunks, freq, highpass=30, lowpass=500, zero_phase=True, overlap=None, axis=0):
+    """
+    Apply bandpass filter to a recorded signal (usually EMG) that is read in blocks (chunks),
+    so that recordings larger than memory can be filtered.
+    In zero-phase mode, output matches filter_bandpass within tolerance.
+    In causal mode, the filter is applied forward only for online use.
+
+    Example:
+        chunks = (emg[i : i + 10000] for i in range(0, emg.size, 10000))
+        for chunk_filt in filter_bandpass_chunks(chunks, freq=2000):
+            ...
+
+    :param chunks: blocks of data
+    :type chunks: iterable
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param highpass: high pass cut-off (Hz)
+    :type highpass: int
+    :param lowpass: low pass cut-off (Hz)
+    :type lowpass: int
+    :param zero_phase: apply filter forward and backward
+    :type zero_phase: bool
+    :param overlap: samples of look-ahead between blocks in zero-phase mode, estimated if None
+    :type overlap: int
+    :param axis: axis of samples in each block
+    :type axis: int
+    :return: blocks of filtered data
+    :rtype: generator
+    """
+    sos = design_butter(4, freq, (highpass, lowpass), 'bandpass')
+    filt = ChunkedFilter(sos, zero_phase=zero_phase, overlap=overlap, axis=axis)
+    return filt.filter(chunks)
+
+
+@accepts_recording
+def rectify(data, plot=False, dtype=None, out=None):
     """
     Rectify a recorded signal (usually EMG) to get absolute values.
 
@@ -68,11 +134,16 @@ def rectify(data, plot=False):
     :type data: ndarray
     :param plot: show plot of original and rectified data
     :type plot: bool
+    :param dtype: data type of result, see set_dtype
+    :type dtype: dtype
+    :param out: array to write result to, can be data to process in place
+    :type out: ndarray
     :return: rectified data
     :rtype: ndarray
     """
-    data_rect = abs(data)
+    data_rect = np.abs(data, out=prepare_out(data, dtype, out), casting='same_kind')
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data, label='original')
@@ -84,20 +155,31 @@ def rectify(data, plot=False):
     return data_rect
 
 
-def find_mvc(data, plot=False):
+@accepts_recording
+def find_mvc(data, plot=False, axis=0):
     """
     Find index and value of MVC EMG.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis,
+    giving one index and value per channel.
 
     :param data: data
     :type data: ndarray
     :param plot: show plot of data and MVC value
     :type plot: bool
-    :return: index and value at MVC EMG or force
+    :param axis: axis of samples
+    :type axis: int
+    :return: index and value at MVC EMG or force (ndarray for multi-channel data)
     :rtype: int or float
     """
-    mvc_value = np.max(data)
-    mvc_index = int(np.where(data == mvc_value)[0][0])
+    if np.ndim(data) > 1:
+        best = np.expand_dims(np.argmax(data, axis=axis), axis)
+        mvc_index = np.squeeze(best, axis)
+        mvc_value = np.squeeze(np.take_along_axis(data, best, axis=axis), axis)
+    else:
+        mvc_index = int(np.argmax(data))
+        mvc_value = data[mvc_index]
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data)
@@ -123,17 +205,69 @@ def calc_halfwidth(freq, window):
     return halfwidth
 
 
-def calc_mvc(data, mvc_index, mvc_value, freq, window, type='rms', plot=False):
+@accepts_recording
+@memoize
+def find_mvc_window(data, freq, window, type='rms', axis=0):
+    """
+    Find the window of time with the largest root-mean-square ('rms') or mean ('mean'),
+    as a measure of MVC EMG that is robust to single-sample spikes.
+    All full windows are evaluated in one pass with a cumulative sum, so time does not depend on window width.
+    Multi-channel or multi-trial data (eg. samples x channels, or samples x trials x channels)
+    are processed along the nominated axis in one call.
+    The window spans index - halfwidth to index + halfwidth (see calc_halfwidth), as for calc_mvc,
+    so calc_mvc with the returned index gives the returned value.
+
+    Example:
+        mvc_index, mvc_value = find_mvc_window(emg_rect, freq=2000, window=500)
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param type: mean or rms
+    :type type: str
+    :param axis: axis of samples
+    :type axis: int
+    :return: index at the centre of the MVC window and MVC EMG, as arrays over the other axes (int and float for 1D data)
+    :rtype: ndarray or tuple
+    """
+    if type not in ('rms', 'mean'):
+        raise ValueError("Expected type 'rms' or 'mean', got {!r}".format(type))
+    data = np.asarray(data, dtype=np.float64)
+    axis = axis % data.ndim
+    halfwidth = calc_halfwidth(freq, window)
+    width = 2 * halfwidth
+    n = data.shape[axis]
+    if halfwidth < 1 or n < width:
+        raise ValueError('Window of {} samples does not fit in {} samples'.format(width, n))
+    start = np.arange(n - width + 1)
+    totals = range_sum(data ** 2 if type == 'rms' else data, start, start + width, axis=axis)
+    best = np.expand_dims(np.argmax(totals, axis=axis), axis)
+    mvc_value = np.squeeze(np.take_along_axis(totals, best, axis=axis), axis) / width
+    if type == 'rms':
+        mvc_value = np.sqrt(np.maximum(mvc_value, 0))
+    mvc_index = np.squeeze(best, axis) + halfwidth
+    if data.ndim == 1:
+        return int(mvc_index), float(mvc_value)
+    return mvc_index, mvc_value
+
+
+@accepts_recording
+def calc_mvc(data, mvc_index, mvc_value, freq, window, type='rms', plot=False, axis=0):
     """
     Calculate average MVC EMG using the root-mean-square ('rms')
     or using the mean over a window of time across the peak EMG ('mean').
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis,
+    with one index and value per channel (eg. from find_mvc), giving one MVC EMG per channel.
 
     :param data: data
     :type data: ndarray
-    :param mvc_index: index at MVC EMG or force
-    :type mvc_index: int
-    :param mvc_value: value of MVC EMG or force
-    :type mvc_value: float
+    :param mvc_index: index at MVC EMG or force, or one index per channel
+    :type mvc_index: int or ndarray
+    :param mvc_value: value of MVC EMG or force, or one value per channel
+    :type mvc_value: float or ndarray
     :param freq: sampling rate (Hz)
     :type freq: int
     :param window: window of time (ms)
@@ -142,15 +276,27 @@ def calc_mvc(data, mvc_index, mvc_value, freq, window, type='rms', plot=False):
     :type type: str
     :param plot: show plot of data and window across peak EMG
     :type plot: bool
-    :return: MVC EMG
+    :param axis: axis of samples
+    :type axis: int
+    :return: MVC EMG (ndarray for multi-channel data)
     :rtype: float
     """
+    if np.ndim(data) > 1:
+        columns = np.moveaxis(np.asarray(data), axis, 0)
+        shape = columns.shape[1:]
+        columns = columns.reshape(columns.shape[0], -1)
+        index = np.broadcast_to(mvc_index, shape).ravel()
+        value = np.broadcast_to(mvc_value, shape).ravel()
+        mvc = [calc_mvc(columns[:, i], int(index[i]), value[i], freq, window, type, plot)
+               for i in range(columns.shape[1])]
+        return np.reshape(mvc, shape)
     halfwidth = calc_halfwidth(freq, window)
     if type == 'rms':
         mvc = np.sqrt(np.mean((data[mvc_index - halfwidth : mvc_index + halfwidth]) ** 2))
     elif type == 'mean':
         mvc = np.mean(data[mvc_index - halfwidth : mvc_index + halfwidth])
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data)
@@ -163,9 +309,14 @@ def calc_mvc(data, mvc_index, mvc_value, freq, window, type='rms', plot=False):
     return mvc
 
 
-def calc_rms(data, freq, window, plot=False):
+@accepts_recording
+@memoize
+def calc_rms(data, freq, window, axis=0, plot=False):
     """
     Process a recorded signal (usually EMG) using a moving root-mean-square window.
+    Window is smaller at the start and the end of the signal. Windows that reach the end of the signal
+    stop before the last sample, except the window of the last sample itself.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
 
     Example:
         import numpy as np
@@ -183,24 +334,17 @@ def calc_rms(data, freq, window, plot=False):
     :type freq: int
     :param window: window of time (ms)
     :type window: int
+    :param axis: axis of samples
+    :type axis: int
     :param plot: show plot of original and rms data
     :type plot: bool
     :return: RMS data
     :rtype: ndarray
     """
     halfwidth = calc_halfwidth(freq, window)
-    # Initialise variable.
-    data_rms = np.zeros(data.size)
-    # Loop through and compute normalised moving window.
-    # Window is smaller at the start and the end of the signal.
-    for i in range(data.size - 1):
-        if i < halfwidth:
-            data_rms[i] = np.sqrt(np.mean((data[0 : i + halfwidth]) ** 2))
-        elif i > data.size - halfwidth:
-            data_rms[i] = np.sqrt(np.mean((data[i - halfwidth : data.size - 1]) ** 2))
-        else:
-            data_rms[i] = np.sqrt(np.mean((data[i - halfwidth : i + halfwidth]) ** 2))
+    data_rms = moving_rms(data, halfwidth, axis=axis, exclude_last=True)
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data, label='original')
@@ -212,9 +356,14 @@ def calc_rms(data, freq, window, plot=False):
     return data_rms
 
 
-def calc_mean(data, mvc, freq, window, plot=False):
+@accepts_recording
+@memoize
+def calc_mean(data, mvc, freq, window, axis=0, plot=False):
     """
     Process a recorded signal (usually EMG) using a moving average normalised to MVC.
+    Window is smaller at the start and the end of the signal. Windows that reach the end of the signal
+    stop before the last sample, except the window of the last sample itself.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
 
     Example:
         import numpy as np
@@ -228,30 +377,23 @@ def calc_mean(data, mvc, freq, window, plot=False):
 
     :param data: data
     :type data: ndarray
-    :param mvc: MVC EMG
-    :type mvc: float
+    :param mvc: MVC EMG, or one MVC EMG per channel
+    :type mvc: float or ndarray
     :param freq: sampling rate (Hz)
     :type freq: int
     :param window: window of time (ms)
     :type window: int
+    :param axis: axis of samples
+    :type axis: int
     :param plot: show plot of original (V) and mean (%MVC) data
     :type plot: bool
     :return: mean data (% MVC)
     :rtype: ndarray
     """
     halfwidth = calc_halfwidth(freq, window)
-    # Initialise variable.
-    data_mean = np.zeros(data.size)
-    # Loop through and compute normalised moving window.
-    # Window is smaller at the start and the end of the signal.
-    for i in range(data.size - 1):
-        if i < halfwidth:
-            data_mean[i] = np.mean(data[0: i + halfwidth]) / mvc * 100
-        elif i > data.size - halfwidth:
-            data_mean[i] = np.mean(data[i - halfwidth: data.size - 1]) / mvc * 100
-        else:
-            data_mean[i] = np.mean(data[i - halfwidth: i + halfwidth]) / mvc * 100
+    data_mean = moving_mean(data, halfwidth, axis=axis, exclude_last=True) / mvc * 100
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         fig, ax1 = plt.subplots()
@@ -271,6 +413,89 @@ def calc_mean(data, mvc, freq, window, plot=False):
     return data_mean
 
 
+@accepts_recording
+def calc_tkeo(data, axis=0):
+    """
+    Apply the Teager-Kaiser energy operator, psi[n] = x[n]**2 - x[n-1] * x[n+1], to a recorded signal (usually EMG).
+    The operator emphasises sudden increases in amplitude and frequency of motor unit activity,
+    which sharpens onsets of EMG bursts relative to background noise.
+    The first and last samples repeat their neighbours.
+
+    :param data: data
+    :type data: ndarray
+    :param axis: axis of samples
+    :type axis: int
+    :return: Teager-Kaiser energy
+    :rtype: ndarray
+    """
+    x = np.moveaxis(np.asarray(data, dtype=np.float64), axis, 0)
+    psi = np.empty_like(x)
+    psi[1:-1] = x[1:-1] ** 2 - x[:-2] * x[2:]
+    if x.shape[0] > 2:
+        psi[0], psi[-1] = psi[1], psi[-2]
+    else:
+        psi[:] = x ** 2
+    return np.moveaxis(psi, 0, axis)
+
+
+@accepts_recording
+@memoize
+def find_bursts(data, freq, window=50, baseline=None, n_sd=3, min_duration=50, min_gap=0, teager=False, axis=0):
+    """
+    Find onsets and offsets of EMG bursts, when the envelope rises above and falls below a threshold
+    relative to a baseline (rest) period: the baseline mean plus n_sd baseline standard deviations,
+    calculated for each channel.
+    The envelope is the moving mean of the rectified signal (see calc_mean), optionally after the
+    Teager-Kaiser energy operator (see calc_tkeo). Bursts separated by less than min_gap are merged,
+    then bursts shorter than min_duration are dropped. Only complete bursts are returned,
+    so a burst in progress at the start or end of the signal is not included.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
+
+    Example:
+        onsets, offsets = find_bursts(emg_filt, freq=2000, baseline=(0, 2000), n_sd=3, min_duration=30)
+        # hysteresis: burst starts above 3 SD and ends below 2 SD
+        onsets, offsets = find_bursts(emg_filt, freq=2000, n_sd=(2, 3), teager=True)
+
+    :param data: data, eg. band pass filtered EMG
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time of the envelope (ms), None if data is already an envelope (eg. from calc_rms)
+    :type window: int
+    :param baseline: start and stop indices of the baseline period, first 500 ms if None
+    :type baseline: tuple
+    :param n_sd: number of baseline standard deviations, or tuple of low and high numbers for hysteresis
+    :type n_sd: float or tuple
+    :param min_duration: minimum burst duration (ms)
+    :type min_duration: float
+    :param min_gap: minimum gap between bursts (ms)
+    :type min_gap: float
+    :param teager: apply the Teager-Kaiser energy operator first
+    :type teager: bool
+    :param axis: axis of samples
+    :type axis: int
+    :return: onset and offset indices, or lists of onset and offset indices for each channel, as for find_index_digital
+    :rtype: ndarray or list
+    """
+    x = np.moveaxis(np.asarray(data, dtype=np.float64), axis, 0)
+    if teager:
+        x = calc_tkeo(x)
+    envelope = np.abs(x)
+    if window:
+        envelope = moving_mean(envelope, calc_halfwidth(freq, window))
+    start, stop = baseline if baseline is not None else (0, round(0.5 * freq))
+    base = envelope[start:stop]
+    if base.shape[0] < 2:
+        raise ValueError('Baseline period must have at least 2 samples, got {}'.format(base.shape[0]))
+    base_sd = np.std(base, axis=0, keepdims=True)
+    # A flat baseline has no threshold, so no bursts are found.
+    base_sd[base_sd == 0] = np.inf
+    score = (envelope - np.mean(base, axis=0, keepdims=True)) / base_sd
+    threshold = tuple(n_sd) if np.ndim(n_sd) else n_sd
+    return find_pulses(score, threshold=threshold, min_width=round(min_duration / 1000 * freq),
+                       min_gap=round(min_gap / 1000 * freq), axis=0)
+
+
 """
 if __name__ == '__main__':
     import sys
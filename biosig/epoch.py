@@ -0,0 +1,177 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+
+from biosig.emg.process import calc_halfwidth
+from biosig.moving import range_sum
+
+
+def calc_epoch_width(freq, pre, post):
+    """
+    For windows of time (ms) before and after an event, calculate the window widths (samples).
+    Uses the same conversion from time to samples as calc_halfwidth.
+
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param pre: window of time before event (ms)
+    :type pre: int
+    :param post: window of time after event (ms)
+    :type post: int
+    :return: samples before and after event
+    :rtype: int
+    """
+    return calc_halfwidth(freq, 2 * pre), calc_halfwidth(freq, 2 * post)
+
+
+def _epoch_bounds(n, events, freq, pre, post):
+    """
+    Find start and stop indices of the window around each event, and clip them to the signal.
+    """
+    events = np.asarray(events, dtype=np.int64).ravel()
+    n_pre, n_post = calc_epoch_width(freq, pre, post)
+    start, stop = events - n_pre, events + n_post
+    return start, stop, np.clip(start, 0, n), np.clip(stop, 0, n)
+
+
+def make_epochs(data, events, freq, pre, post, axis=0):
+    """
+    Cut windows of data around events (eg. trigger indices from find_index_digital).
+    Each epoch runs from pre (ms) before to post (ms) after the event, with the event sample
+    at index n_pre of each epoch (see calc_epoch_width).
+
+    If events are equally spaced and all windows lie within the signal, the returned epochs are
+    a read-only view of data and no samples are copied. Otherwise epochs are gathered into a single
+    array, and samples of windows that extend beyond the signal are filled with NaN.
+
+    Example:
+        start_idx, stop_idx = find_index_digital(trigger, 1)
+        epochs = make_epochs(emg, start_idx, freq=2000, pre=50, post=200)
+        response = np.nanmean(epochs, axis=0)
+
+    :param data: data, 1D or samples x channels
+    :type data: ndarray
+    :param events: event indices
+    :type events: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param pre: window of time before event (ms)
+    :type pre: int
+    :param post: window of time after event (ms)
+    :type post: int
+    :param axis: axis of samples
+    :type axis: int
+    :return: epochs, events x samples (x channels)
+    :rtype: ndarray
+    """
+    data = np.moveaxis(np.asarray(data), axis, 0)
+    n = data.shape[0]
+    start, stop, start_clip, stop_clip = _epoch_bounds(n, events, freq, pre, post)
+    width = int(stop[0] - start[0]) if start.size else 0
+    inside = (start >= 0) & (stop <= n)
+    step = np.diff(start)
+    if start.size and inside.all() and (step.size == 0 or (step == step[0]).all()):
+        step = int(step[0]) if step.size else 0
+        shape = (start.size, width) + data.shape[1:]
+        strides = (step * data.strides[0],) + data.strides
+        return as_strided(data[start[0]:], shape=shape, strides=strides, writeable=False)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    epochs = np.full((start.size, width) + data.shape[1:], np.nan, dtype=data.dtype)
+    if width and n >= width:
+        # Gather windows within the signal in one pass.
+        windows = sliding_window_view(data, width, axis=0)
+        epochs[inside] = np.moveaxis(windows[start[inside]], -1, 1)
+    # Copy the part of windows at the edges that lies within the signal.
+    for i in np.flatnonzero(~inside):
+        if stop_clip[i] > start_clip[i]:
+            epochs[i, start_clip[i] - start[i] : stop_clip[i] - start[i]] = data[start_clip[i] : stop_clip[i]]
+    return epochs
+
+
+def _range_peak(data, start, stop):
+    """
+    Calculate the maximum of data between pairs of start and stop indices, without copying windows.
+    """
+    peak = np.full((start.size,) + data.shape[1:], np.nan)
+    valid = stop > start
+    # reduceat over interleaved (start, stop) indices reduces data[start:stop] at even positions,
+    # but indices must be within the signal, so windows that end at the last sample are done separately.
+    at_end = valid & (stop == data.shape[0])
+    mid = valid & ~at_end
+    if mid.any():
+        idx = np.column_stack((start[mid], stop[mid])).ravel()
+        peak[mid] = np.maximum.reduceat(data, idx, axis=0)[::2]
+    for i in np.flatnonzero(at_end):
+        peak[i] = data[start[i]:].max(axis=0)
+    return peak
+
+
+def reduce_epochs(data, events, freq, pre, post, type='mean', axis=0):
+    """
+    Calculate the mean, root-mean-square ('rms'), peak or area of data in windows around events,
+    without cutting out each epoch. Mean, RMS and area are computed from a single cumulative sum.
+    Windows that extend beyond the signal are clipped to the signal.
+
+    With pre = post = window / 2, an RMS epoch around the MVC index is the MVC EMG of calc_mvc.
+
+    Example:
+        start_idx, stop_idx = find_index_digital(trigger, 1)
+        rms = reduce_epochs(emg, start_idx, freq=2000, pre=0, post=50, type='rms')
+
+    :param data: data, 1D or samples x channels
+    :type data: ndarray
+    :param events: event indices
+    :type events: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param pre: window of time before event (ms)
+    :type pre: int
+    :param post: window of time after event (ms)
+    :type post: int
+    :param type: mean, rms, peak or area (data units x sec)
+    :type type: str
+    :param axis: axis of samples
+    :type axis: int
+    :return: value for each event, events (x channels)
+    :rtype: ndarray
+    """
+    data = np.moveaxis(np.asarray(data, dtype=np.float64), axis, 0)
+    _, _, start, stop = _epoch_bounds(data.shape[0], events, freq, pre, post)
+    if type == 'peak':
+        return _range_peak(data, start, stop)
+    count = (stop - start).reshape((-1,) + (1,) * (data.ndim - 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if type == 'mean':
+            return range_sum(data, start, stop) / count
+        elif type == 'rms':
+            mean_sq = np.maximum(range_sum(data ** 2, start, stop) / count, 0)
+            return np.sqrt(mean_sq)
+        elif type == 'area':
+            return np.where(count > 0, range_sum(data, start, stop) / freq, np.nan)
+    raise ValueError("type must be 'mean', 'rms', 'peak' or 'area', got {!r}".format(type))
+
+
+def average_epochs(data, events, freq, pre, post, axis=0):
+    """
+    Average data in windows around events (eg. stimulus responses), ignoring samples beyond the signal.
+
+    :param data: data, 1D or samples x channels
+    :type data: ndarray
+    :param events: event indices
+    :type events: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param pre: window of time before event (ms)
+    :type pre: int
+    :param post: window of time after event (ms)
+    :type post: int
+    :param axis: axis of samples
+    :type axis: int
+    :return: average epoch, samples (x channels)
+    :rtype: ndarray
+    """
+    epochs = make_epochs(data, events, freq, pre, post, axis=axis)
+    start, stop, start_clip, stop_clip = _epoch_bounds(np.shape(data)[axis], events, freq, pre, post)
+    if (start == start_clip).all() and (stop == stop_clip).all():
+        # No NaN padding, so average without the copy made by nanmean.
+        return np.mean(epochs, axis=0)
+    return np.nanmean(epochs, axis=0)
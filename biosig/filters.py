@@ -0,0 +1,276 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+
+@lru_cache(maxsize=128)
+def design_butter(order, freq, cutoff, btype):
+    """
+    Design a Butterworth filter as second-order sections.
+    Designs are cached (least recently used are discarded first), so repeated calls with
+    the same settings do not redesign the filter. Call design_butter.cache_clear() to empty
+    the cache and design_butter.cache_info() for cache statistics.
+    The returned array is shared between callers and must not be changed in place.
+
+    Example:
+        sos = design_butter(4, 2000, (30, 500), 'bandpass')
+        data_filt = signal.sosfiltfilt(sos, data)
+
+    :param order: filter order
+    :type order: int
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param cutoff: cut-off (Hz), or tuple of low and high cut-offs for bandpass
+    :type cutoff: float or tuple
+    :param btype: filter type (eg. low, high, bandpass)
+    :type btype: str
+    :return: second-order sections
+    :rtype: ndarray
+    """
+    sos = signal.butter(order, cutoff, btype=btype, output='sos', fs=freq)
+    return sos
+
+
+def calc_padlen(sos):
+    """
+    Calculate the number of samples used to pad the edges of a signal, as scipy.signal.sosfiltfilt does.
+
+    :param sos: second-order sections of the filter
+    :type sos: ndarray
+    :return: number of samples
+    :rtype: int
+    """
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def calc_settle(sos, tol=1e-9):
+    """
+    Calculate the number of samples for the impulse response of a filter to decay below a tolerance.
+    Used as the overlap between blocks when zero-phase filtering a signal in blocks.
+
+    :param sos: second-order sections of the filter
+    :type sos: ndarray
+    :param tol: tolerance relative to the peak of the impulse response
+    :type tol: float
+    :return: number of samples
+    :rtype: int
+    """
+    _, poles, _ = signal.sos2zpk(sos)
+    radius = np.max(np.abs(poles)) if poles.size else 0
+    if radius <= 0:
+        return 2 * len(sos) + 1
+    if radius >= 1:
+        raise ValueError('Filter is unstable, pole radius is {:.6f}'.format(radius))
+    return int(np.ceil(np.log(tol) / np.log(radius))) + 2 * len(sos) + 1
+
+
+class ChunkedFilter:
+    """
+    Apply a digital filter to a recorded signal that arrives in blocks (chunks) of samples.
+    Filter state is carried from one block to the next, so a recording can be filtered
+    in bounded memory without loading the full trial.
+
+    Causal mode (zero_phase=False) applies the filter forward only, as for online use.
+    Output matches scipy.signal.sosfilt on the full signal with initial conditions
+    set to the steady state of the first sample.
+
+    Zero-phase mode (zero_phase=True) applies the filter forward then backward, as
+    scipy.signal.sosfiltfilt does. The backward pass over each block starts from the
+    end of an overlapping look-ahead of later samples, so output is delayed by
+    `overlap` samples and matches sosfiltfilt on the full signal within tolerance.
+
+    Example:
+        sos = design_butter(4, 2000, (30, 500), 'bandpass')
+        filt = ChunkedFilter(sos)
+        data_filt = np.concatenate(list(filt.filter(chunks)))
+
+    :param sos: second-order sections of the filter
+    :type sos: ndarray
+    :param zero_phase: apply filter forward and backward
+    :type zero_phase: bool
+    :param overlap: samples of look-ahead for the backward pass, estimated from the filter if None
+    :type overlap: int
+    :param axis: axis of samples in each block
+    :type axis: int
+    """
+
+    def __init__(self, sos, zero_phase=True, overlap=None, axis=0):
+        self.sos = np.atleast_2d(sos)
+        self.zero_phase = zero_phase
+        self.overlap = calc_settle(self.sos) if overlap is None else int(overlap)
+        self.axis = axis
+        self.padlen = calc_padlen(self.sos)
+        self._zi = signal.sosfilt_zi(self.sos)
+        self.reset()
+
+    def reset(self):
+        """
+        Clear filter state so that a new recording can be filtered.
+        """
+        self._state = None
+        self._head = []
+        self._head_len = 0
+        self._tail = None
+        self._pending = None
+
+    def _steady(self, x0):
+        """
+        Initial conditions for the steady state of sample x0.
+        """
+        zi = self._zi.reshape(self._zi.shape + (1,) * x0.ndim)
+        return zi * x0
+
+    def _forward(self, x):
+        y, self._state = signal.sosfilt(self.sos, x, axis=0, zi=self._state)
+        return y
+
+    def _backward(self, y, n_out):
+        """
+        Backward pass over y, starting from the steady state of its last sample.
+        Return the first n_out samples.
+        """
+        y_rev = y[::-1]
+        out, _ = signal.sosfilt(self.sos, y_rev, axis=0, zi=self._steady(y_rev[0]))
+        return out[::-1][:n_out]
+
+    def _start(self, x):
+        """
+        Initialise filter state from the first block of samples.
+        """
+        if not self.zero_phase:
+            self._state = self._steady(x[0])
+            return
+        # Run leading odd extension through the filter, as sosfiltfilt does.
+        ext = 2 * x[0] - x[self.padlen:0:-1]
+        self._state = self._steady(ext[0])
+        self._forward(ext)
+        self._pending = x[:0]
+
+    def _keep_tail(self, x):
+        """
+        Keep the last raw samples, needed to pad the end of the signal.
+        """
+        x = x if self._tail is None else np.concatenate((self._tail, x), axis=0)
+        # Copy, as the block may be a view of data that is being filtered in place.
+        self._tail = x[-(self.padlen + 1):].copy()
+
+    def _emit(self, y, final=False):
+        """
+        Add forward-filtered samples and return the samples that can be finalised.
+        """
+        pending = np.concatenate((self._pending, y), axis=0)
+        n_out = pending.shape[0] if final else max(pending.shape[0] - self.overlap, 0)
+        if n_out == 0:
+            self._pending = pending
+            return pending[:0]
+        out = self._backward(pending, n_out)
+        self._pending = pending[n_out:]
+        return out
+
+    def process(self, chunk):
+        """
+        Filter a block of samples.
+
+        :param chunk: block of samples
+        :type chunk: ndarray
+        :return: filtered samples, which may be fewer than supplied in zero-phase mode
+        :rtype: ndarray
+        """
+        x = np.moveaxis(np.asarray(chunk, dtype=np.float64), self.axis, 0)
+        if not x.shape[0]:
+            return np.moveaxis(x, 0, self.axis)
+        if self._state is None:
+            if self.zero_phase:
+                self._head.append(x)
+                self._head_len += x.shape[0]
+                if self._head_len <= self.padlen:
+                    return np.moveaxis(x[:0], 0, self.axis)
+                x = np.concatenate(self._head, axis=0)
+                self._head, self._head_len = [], 0
+            self._start(x)
+        if not self.zero_phase:
+            return np.moveaxis(self._forward(x), 0, self.axis)
+        self._keep_tail(x)
+        return np.moveaxis(self._emit(self._forward(x)), 0, self.axis)
+
+    def finish(self):
+        """
+        Return the remaining filtered samples at the end of the signal, then reset.
+
+        :return: filtered samples
+        :rtype: ndarray
+        """
+        if not self.zero_phase or (self._state is None and not self._head):
+            self.reset()
+            return np.empty(0)
+        if self._state is None:
+            # Signal is too short to stream, filter what was received in one go.
+            x = np.concatenate(self._head, axis=0)
+            out = signal.sosfiltfilt(self.sos, x, axis=0, padlen=x.shape[0] - 1)
+        else:
+            # Run trailing odd extension through the filter, as sosfiltfilt does.
+            x = self._tail
+            ext = 2 * x[-1] - x[-2:-(self.padlen + 2):-1]
+            out = self._emit(self._forward(ext), final=True)[:-self.padlen]
+        self.reset()
+        return np.moveaxis(out, 0, self.axis)
+
+    def filter(self, chunks):
+        """
+        Filter an iterable of blocks of samples, yielding filtered blocks.
+
+        :param chunks: blocks of samples
+        :type chunks: iterable
+        :return: filtered blocks
+        :rtype: generator
+        """
+        for chunk in chunks:
+            out = self.process(chunk)
+            if out.shape[self.axis]:
+                yield out
+        out = self.finish()
+        if out.size:
+            yield out
+
+
+def filter_into(sos, data, out, axis=0, blocksize=65536):
+    """
+    Apply a filter forward and backward (zero-phase), writing the result into an existing array.
+    The signal is filtered in blocks with ChunkedFilter, so temporary memory is bounded by the block size
+    rather than the signal length, and out can be the data itself to filter in place.
+    Result matches scipy.signal.sosfiltfilt within tolerance, rounded to the data type of out.
+
+    :param sos: second-order sections of the filter
+    :type sos: ndarray
+    :param data: data
+    :type data: ndarray
+    :param out: array to write result to, same shape as data
+    :type out: ndarray
+    :param axis: axis of samples
+    :type axis: int
+    :param blocksize: number of samples in each block
+    :type blocksize: int
+    :return: out
+    :rtype: ndarray
+    """
+    filt = ChunkedFilter(sos, axis=axis)
+    n = data.shape[axis]
+    index = [slice(None)] * data.ndim
+    pos = 0
+
+    def put(block):
+        nonlocal pos
+        if not block.size:
+            return
+        index[axis] = slice(pos, pos + block.shape[axis])
+        out[tuple(index)] = block
+        pos += block.shape[axis]
+
+    for start in range(0, n, blocksize):
+        index[axis] = slice(start, start + blocksize)
+        put(filt.process(data[tuple(index)]))
+    put(filt.finish())
+    return out
@@ -2,5 +2,6 @@ __all__ = ['process']
 
 from biosig.force import process
 
-from biosig.force.process import filter_lowpass, calc_var
+from biosig.force.process import filter_lowpass, filter_lowpass_chunks, resample, resample_channels, calc_var, \
+    calc_var_rolling, calc_var_segments, RollingVar, calc_slope_rolling, find_plateaus
 
@@ -1,10 +1,26 @@
+from fractions import Fraction
+
 import numpy as np
-import matplotlib.pyplot as plt
+from scipy import signal
+
+from biosig.filters import design_butter, ChunkedFilter, filter_into
+from biosig.memo import memoize
+from biosig.emg.process import calc_halfwidth
+from biosig.moving import range_sum, moving_sum
+from biosig.spectral import find_pulses
+from biosig.recording import Recording, accepts_recording
+from biosig.precision import result_dtype, prepare_out
 
 
-def filter_lowpass(data, freq, lowpass=30, plot=False):
+@accepts_recording
+@memoize
+def filter_lowpass(data, freq, lowpass=30, axis=0, plot=False, dtype=None, out=None):
     """
     Apply low pass filter to a recorded transducer signal (eg. force).
+    A 4th-order Butterworth filter is applied forward and backward as second-order sections.
+    Multi-channel data (eg. samples x channels) are filtered along the nominated axis in one call.
+    If out is given or the result is not float64, the signal is filtered in blocks into the result
+    (see filter_into), so no full-length float64 copies are made.
 
     :param data: data
     :type data: ndarray
@@ -12,16 +28,24 @@ def filter_lowpass(data, freq, lowpass=30, plot=False):
     :type freq: int
     :param lowpass: low pass cut-off
     :type lowpass: int
+    :param axis: axis of samples
+    :type axis: int
     :param plot: show plot of original and filtered data
     :type plot: bool
+    :param dtype: data type of result, see set_dtype
+    :type dtype: dtype
+    :param out: array to write result to, can be data to process in place
+    :type out: ndarray
     :return: filtered data
     :rtype: ndarray
     """
-    freq_nyq = freq/2
-    high = lowpass/freq_nyq
-    b, a = signal.butter(4, high, btype='low')
-    data_filt = signal.filtfilt(b, a, data)
+    sos = design_butter(4, freq, lowpass, 'low')
+    if out is None and result_dtype(data, dtype) == np.float64:
+        data_filt = signal.sosfiltfilt(sos, data, axis=axis)
+    else:
+        data_filt = filter_into(sos, data, prepare_out(data, dtype, out), axis=axis)
     if plot:
+        import matplotlib.pyplot as plt
         plt.clf()
         plt.close()
         plt.plot(data, label='original')
@@ -33,18 +57,408 @@ def filter_lowpass(data, freq, lowpass=30, plot=False):
     return data_filt
 
 
-def calc_var(data):
+def filter_lowpass_chunks(chunks, freq, lowpass=30, zero_phase=True, overlap=None, axis=0):
+    """
+    Apply low pass filter to a recorded transducer signal (eg. force) that is read in blocks (chunks),
+    so that recordings larger than memory can be filtered.
+    In zero-phase mode, output matches filter_lowpass within tolerance.
+    In causal mode, the filter is applied forward only for online use.
+
+    :param chunks: blocks of data
+    :type chunks: iterable
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param lowpass: low pass cut-off
+    :type lowpass: int
+    :param zero_phase: apply filter forward and backward
+    :type zero_phase: bool
+    :param overlap: samples of look-ahead between blocks in zero-phase mode, estimated if None
+    :type overlap: int
+    :param axis: axis of samples in each block
+    :type axis: int
+    :return: blocks of filtered data
+    :rtype: generator
+    """
+    sos = design_butter(4, freq, lowpass, 'low')
+    filt = ChunkedFilter(sos, zero_phase=zero_phase, overlap=overlap, axis=axis)
+    return filt.filter(chunks)
+
+
+def _resample_ratio(freq, new_freq):
+    """
+    Smallest integer up and down factors of a change of sampling rate.
+    """
+    ratio = Fraction(new_freq).limit_denominator(10000) / Fraction(freq).limit_denominator(10000)
+    return ratio.numerator, ratio.denominator
+
+
+@memoize
+def resample(data, freq, new_freq, lowpass=None, axis=0):
+    """
+    Change the sampling rate of a recorded transducer signal (eg. force), usually to decimate an over-sampled channel.
+    The signal is low pass filtered and resampled in one polyphase pass (scipy.signal.resample_poly):
+    only the samples that are kept are calculated, and the linear-phase FIR filter does not shift the signal in time.
+    By default the filter removes frequencies above half the new sampling rate. A lower cut-off (eg. 30 Hz,
+    as for filter_lowpass) can be nominated to filter and decimate in the same pass.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
+    A Recording is returned as a Recording with the new sampling rate.
+
+    Example:
+        force_100 = resample(force, freq=2000, new_freq=100, lowpass=30)
+        time_100 = make_time(100, force_100)
+        rec_100 = resample(rec.select(['force', 'distance']), None, 100)
+
+    :param data: data, or Recording
+    :type data: ndarray or Recording
+    :param freq: sampling rate (Hz), sampling rate of the recording if None
+    :type freq: int
+    :param new_freq: new sampling rate (Hz)
+    :type new_freq: int
+    :param lowpass: low pass cut-off (Hz), half the new sampling rate if None
+    :type lowpass: float
+    :param axis: axis of samples
+    :type axis: int
+    :return: resampled data
+    :rtype: ndarray or Recording
+    """
+    if isinstance(data, Recording):
+        return data._new(resample(data.data, data.freq if freq is None else freq, new_freq, lowpass), freq=new_freq)
+    up, down = _resample_ratio(freq, new_freq)
+    cutoff = new_freq / 2 if lowpass is None else min(lowpass, new_freq / 2)
+    # Filter length as resample_poly uses for the new Nyquist frequency, longer for a lower cut-off.
+    # resample_poly scales the taps by up for the gain of zero stuffing.
+    half_len = 10 * max(up, down, int(np.ceil(freq / (2 * cutoff))))
+    taps = signal.firwin(2 * half_len + 1, cutoff, window=('kaiser', 5.0), fs=freq * up)
+    return signal.resample_poly(np.asarray(data, dtype=np.float64), up, down, axis=axis, window=taps)
+
+
+def resample_channels(recording, rates, lowpass=None):
+    """
+    Resample channels of a recording to different sampling rates (eg. force and distance to 100 Hz, EMG kept at 2000 Hz).
+    Channels are grouped by sampling rate, and each group is returned as a Recording with its own sampling rate,
+    so time (Recording.time or make_time) and windows in ms stay correct for every channel.
+
+    Example:
+        recs = resample_channels(rec, {'force': 100, 'distance': 100}, lowpass={'force': 30})
+        force = recs[100]['force']
+        emg = recs[2000]['emg']
+
+    :param recording: recording
+    :type recording: Recording
+    :param rates: dictionary of channel names and new sampling rates (Hz), other channels are not resampled
+    :type rates: dict
+    :param lowpass: low pass cut-off (Hz) of all resampled channels, or dictionary of channel names and cut-offs
+    :type lowpass: float or dict
+    :return: dictionary of sampling rates and recordings
+    :rtype: dict
+    """
+    groups = {}
+    for channel in recording.channels:
+        new_freq = rates.get(channel, recording.freq)
+        cutoff = lowpass.get(channel) if isinstance(lowpass, dict) else lowpass
+        groups.setdefault((new_freq, cutoff), []).append(channel)
+    parts = {}
+    for (new_freq, cutoff), channels in groups.items():
+        part = recording.select(channels)
+        if new_freq != recording.freq or cutoff is not None:
+            part = resample(part, None, new_freq, cutoff)
+        parts.setdefault(new_freq, []).append(part)
+    recordings = {}
+    for new_freq, group in parts.items():
+        data = np.column_stack([part.data for part in group]) if len(group) > 1 else group[0].data
+        channels = [channel for part in group for channel in part.channels]
+        recordings[new_freq] = Recording(data, channels, new_freq, recording.t0, recording.meta)
+    return recordings
+
+
+@accepts_recording
+def calc_var(data, axis=0):
     """
     Calculate standard deviation and coefficient of variation of a recorded transducer signal (eg. force).
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis,
+    giving one value per channel.
 
     :param data: data
     :type data: ndarray
-    :return: standard deviation and coefficient of variation
+    :param axis: axis of samples
+    :type axis: int
+    :return: standard deviation and coefficient of variation (ndarray for multi-channel data)
     :rtype: float
     """
-    std_dev = np.std(data)
-    cv = np.std(data) / np.mean(data)
+    std_dev = np.std(data, axis=axis)
+    cv = std_dev / np.mean(data, axis=axis)
     # print('Standard deviation (N): {:.3f}'.format(std_dev))
     # print('Coeff of variation: {:.3f}'.format(cv))
     return std_dev, cv
 
+
+def _shift(data, axis):
+    """
+    Subtract the mean of each channel, so that cumulative moments stay small and variance is not lost
+    to rounding when the mean is large relative to the variability (eg. force during a contraction).
+    """
+    data = np.asarray(data, dtype=np.float64)
+    ref = np.mean(data, axis=axis, keepdims=True)
+    return data - ref, ref
+
+
+def _moments_to_var(sum1, sum2, count, ref):
+    """
+    Standard deviation and coefficient of variation from sums of shifted values and squared values.
+    """
+    mean = sum1 / count
+    var = sum2 / count - mean ** 2
+    # Differences of a cumulative sum can round to tiny negative values.
+    np.maximum(var, 0, out=var)
+    std_dev = np.sqrt(var)
+    return std_dev, std_dev / (mean + ref)
+
+
+@accepts_recording
+@memoize
+def calc_var_rolling(data, freq, window, axis=0):
+    """
+    Calculate standard deviation and coefficient of variation of a recorded transducer signal (eg. force)
+    over a centred moving window, as calc_var does for the full signal.
+    Window is smaller at the start and the end of the signal.
+    Runs in O(n) regardless of window width, using cumulative sums of values and squared values
+    about the mean of each channel. Multi-channel data (eg. samples x channels) are processed
+    along the nominated axis.
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param axis: axis of samples
+    :type axis: int
+    :return: standard deviation and coefficient of variation of each window
+    :rtype: ndarray
+    """
+    shifted, ref = _shift(data, axis)
+    halfwidth = calc_halfwidth(freq, window)
+    sum1, count = moving_sum(shifted, halfwidth, axis=axis)
+    sum2, _ = moving_sum(shifted ** 2, halfwidth, axis=axis)
+    return _moments_to_var(sum1, sum2, count, ref)
+
+
+@memoize
+def calc_var_segments(data, start_idx, stop_idx, axis=0):
+    """
+    Calculate standard deviation and coefficient of variation of a recorded transducer signal (eg. force)
+    over many segments (eg. plateaus of several contractions), in one pass over the signal.
+
+    Example:
+        std_dev, cv = calc_var_segments(force, *find_index_digital(trigger, 1))
+        # list of (start, stop) pairs
+        std_dev, cv = calc_var_segments(force, *zip(*segments))
+
+    :param data: data
+    :type data: ndarray
+    :param start_idx: start index of each segment
+    :type start_idx: ndarray
+    :param stop_idx: stop index of each segment (excluded)
+    :type stop_idx: ndarray
+    :param axis: axis of samples
+    :type axis: int
+    :return: standard deviation and coefficient of variation of each segment, along the axis of samples
+    :rtype: ndarray
+    """
+    shifted, ref = _shift(data, axis)
+    axis = axis % shifted.ndim
+    start_idx = np.asarray(start_idx, dtype=np.int64)
+    stop_idx = np.asarray(stop_idx, dtype=np.int64)
+    if np.any(stop_idx <= start_idx):
+        raise ValueError('Each segment must stop after it starts')
+    sum1 = range_sum(shifted, start_idx, stop_idx, axis=axis)
+    sum2 = range_sum(shifted ** 2, start_idx, stop_idx, axis=axis)
+    shape = [1] * shifted.ndim
+    shape[axis] = start_idx.size
+    return _moments_to_var(sum1, sum2, (stop_idx - start_idx).reshape(shape), ref)
+
+
+@accepts_recording
+@memoize
+def calc_slope_rolling(data, freq, window, axis=0):
+    """
+    Calculate the least-squares slope (units per second) of a recorded transducer signal (eg. force)
+    over a centred moving window. Window is smaller at the start and the end of the signal.
+    Runs in O(n) regardless of window width, using cumulative sums.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param axis: axis of samples
+    :type axis: int
+    :return: slope of each window
+    :rtype: ndarray
+    """
+    shifted, _ = _shift(data, axis)
+    axis = axis % shifted.ndim
+    n = shifted.shape[axis]
+    halfwidth = calc_halfwidth(freq, window)
+    # Sample number about the middle of the signal, so that cumulative sums stay small.
+    idx = np.arange(n, dtype=np.float64) - (n - 1) / 2
+    shape = [1] * shifted.ndim
+    shape[axis] = n
+    sum_x, count = moving_sum(shifted, halfwidth, axis=axis)
+    sum_tx, _ = moving_sum(shifted * idx.reshape(shape), halfwidth, axis=axis)
+    sum_t, _ = moving_sum(idx, halfwidth)
+    sum_tt, _ = moving_sum(idx ** 2, halfwidth)
+    sum_t, sum_tt = sum_t.reshape(shape), sum_tt.reshape(shape)
+    denom = count * sum_tt - sum_t ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (count * sum_tx - sum_t * sum_x) / denom
+    # A window of one sample has no slope.
+    return np.where(denom > 0, slope, 0) * freq
+
+
+@memoize
+def find_plateaus(data, freq, window=500, max_slope=None, max_sd=None, min_level=None,
+                  min_duration=1000, min_gap=0, axis=0):
+    """
+    Find steady (plateau) segments of a recorded transducer signal (eg. low pass filtered force),
+    where the slope and standard deviation over a centred moving window are small and the level is
+    above rest. Limits default to fractions of the range of each channel: slope below 5% of the range
+    per second, standard deviation below 2% of the range and level above 10% of the range.
+    Segments separated by less than min_gap are merged, then segments shorter than min_duration are dropped.
+    Multi-channel data (eg. samples x channels) are processed along the nominated axis.
+
+    Segments can be passed straight to variability and MVC calculations.
+
+    Example:
+        force_filt = filter_lowpass(force, freq=2000)
+        start_idx, stop_idx = find_plateaus(force_filt, freq=2000, window=500, min_duration=2000)
+        std_dev, cv = calc_var_segments(force_filt, start_idx, stop_idx)
+        mvc_index, mvc_value = find_mvc_window(force_filt[start_idx[0]:stop_idx[0]], 2000, 500)
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param max_slope: maximum absolute slope (units per second), or one limit per channel
+    :type max_slope: float or ndarray
+    :param max_sd: maximum standard deviation, or one limit per channel
+    :type max_sd: float or ndarray
+    :param min_level: minimum level, or one limit per channel
+    :type min_level: float or ndarray
+    :param min_duration: minimum plateau duration (ms)
+    :type min_duration: float
+    :param min_gap: minimum gap between plateaus (ms)
+    :type min_gap: float
+    :param axis: axis of samples
+    :type axis: int
+    :return: start and stop indices, or lists of start and stop indices for each channel, as for find_index_digital
+    :rtype: ndarray or list
+    """
+    x = np.moveaxis(np.asarray(data, dtype=np.float64), axis, 0)
+    low, high = np.min(x, axis=0), np.max(x, axis=0)
+    span = high - low
+    max_slope = 0.05 * span if max_slope is None else max_slope
+    max_sd = 0.02 * span if max_sd is None else max_sd
+    min_level = low + 0.1 * span if min_level is None else min_level
+    slope = calc_slope_rolling(x, freq, window)
+    std_dev, _ = calc_var_rolling(x, freq, window)
+    steady = (np.abs(slope) <= max_slope) & (std_dev <= max_sd) & (x >= min_level)
+    return find_pulses(steady.view(np.int8), 1, min_width=round(min_duration / 1000 * freq),
+                       min_gap=round(min_gap / 1000 * freq), axis=0)
+
+
+class RollingVar:
+    """
+    Calculate standard deviation and coefficient of variation of a transducer signal (eg. force)
+    that arrives in blocks of samples, eg. during acquisition or when reading with iter_data.
+
+    For each block, the standard deviation and coefficient of variation over a moving window ending at
+    each sample are returned (the window is smaller until it is full). Statistics of all samples so far
+    are updated block by block with Welford's method, combining the mean and sum of squared deviations
+    of each block, and are available as std_dev and cv.
+
+    Example:
+        var = RollingVar(freq=2000, window=1000)
+        for block in iter_data('V_L.txt', channels):
+            std_dev, cv = var.process(block['force'])
+        print(var.std_dev, var.cv)
+
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    """
+
+    def __init__(self, freq, window):
+        self.width = max(2 * calc_halfwidth(freq, window), 1)
+        self.reset()
+
+    def reset(self):
+        """
+        Clear statistics and window so that a new recording can be processed.
+        """
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+        self._history = None
+        self._ref = None
+
+    @property
+    def std_dev(self):
+        """
+        Standard deviation of all samples so far.
+        """
+        return np.sqrt(self._m2 / self.count) if self.count else None
+
+    @property
+    def cv(self):
+        """
+        Coefficient of variation of all samples so far.
+        """
+        return self.std_dev / self.mean if self.count else None
+
+    def _update_total(self, x):
+        n = x.shape[0]
+        mean = np.mean(x, axis=0)
+        m2 = np.sum((x - mean) ** 2, axis=0)
+        if not self.count:
+            self.mean, self._m2 = mean, m2
+        else:
+            delta = mean - self.mean
+            total = self.count + n
+            self.mean = self.mean + delta * n / total
+            self._m2 = self._m2 + m2 + delta ** 2 * self.count * n / total
+        self.count += n
+
+    def process(self, block):
+        """
+        Process a block of samples.
+
+        :param block: block of samples, 1D or samples x channels
+        :type block: ndarray
+        :return: standard deviation and coefficient of variation over the window ending at each sample
+        :rtype: ndarray
+        """
+        x = np.asarray(block, dtype=np.float64)
+        if not x.shape[0]:
+            return x.copy(), x.copy()
+        if self._history is None:
+            self._history = x[:0]
+            # Shift values by the first sample, so that cumulative moments stay small.
+            self._ref = x[0].copy()
+        n_hist = self._history.shape[0]
+        values = np.concatenate((self._history, x - self._ref), axis=0)
+        pad = np.zeros((1,) + values.shape[1:])
+        sum1 = np.concatenate((pad, np.cumsum(values, axis=0)), axis=0)
+        sum2 = np.concatenate((pad, np.cumsum(values ** 2, axis=0)), axis=0)
+        stop = np.arange(n_hist + 1, values.shape[0] + 1)
+        start = np.maximum(stop - self.width, 0)
+        count = (stop - start).reshape((-1,) + (1,) * (x.ndim - 1))
+        result = _moments_to_var(sum1[stop] - sum1[start], sum2[stop] - sum2[start], count, self._ref)
+        self._history = values[-(self.width - 1):] if self.width > 1 else values[:0]
+        self._update_total(x)
+        return result
@@ -0,0 +1,278 @@
+import os
+import pickle
+import hashlib
+import inspect
+import warnings
+from functools import wraps
+
+import numpy as np
+
+from biosig.precision import get_dtype
+
+
+# Memoization is off unless a cache directory is set with enable_memo,
+# or with the BIOSIG_MEMO_DIR environment variable (eg. for worker processes).
+_config = {'cache_dir': None, 'max_size': None}
+_stats = {}
+
+
+def enable_memo(cache_dir, max_size=None):
+    """
+    Save results of processing functions to a disk cache, and reuse them when a function is
+    called again with the same input data and parameters.
+
+    Example:
+        enable_memo('/home/joanna/biosig_cache', max_size=20 * 2**30)
+
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :param max_size: maximum total size of cache (bytes), least recently used results are deleted
+    :type max_size: int
+    """
+    _config['cache_dir'] = cache_dir
+    _config['max_size'] = max_size
+
+
+def disable_memo():
+    """
+    Stop saving and reusing results of processing functions. The disk cache is kept.
+    """
+    _config['cache_dir'] = None
+    _config['max_size'] = None
+
+
+def _cache_dir():
+    return _config['cache_dir'] or os.environ.get('BIOSIG_MEMO_DIR')
+
+
+def memo_stats():
+    """
+    Number of cache hits and misses of each memoized function in this process.
+
+    :return: dictionary of function names and dictionaries of hits and misses
+    :rtype: dict
+    """
+    return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def _func_name(func):
+    return '{}.{}'.format(func.__module__, func.__qualname__)
+
+
+def clear_memo(func=None, cache_dir=None):
+    """
+    Delete cached results of one memoized function, or of all functions.
+
+    :param func: memoized function, all functions if None
+    :type func: function
+    :param cache_dir: cache directory, as set by enable_memo if None
+    :type cache_dir: str
+    :return: number of results deleted
+    :rtype: int
+    """
+    cache_dir = cache_dir or _cache_dir()
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    names = [_func_name(func)] if func is not None else os.listdir(cache_dir)
+    deleted = 0
+    for name in names:
+        path_func = os.path.join(cache_dir, name)
+        if not os.path.isdir(path_func):
+            continue
+        for entry in os.listdir(path_func):
+            os.remove(os.path.join(path_func, entry))
+            deleted += 1
+    return deleted
+
+
+def evict_memo(max_size, cache_dir=None):
+    """
+    Delete least recently used cached results until the cache is no larger than max_size.
+
+    :param max_size: maximum total size of cache (bytes)
+    :type max_size: int
+    :param cache_dir: cache directory, as set by enable_memo if None
+    :type cache_dir: str
+    :return: number of results deleted
+    :rtype: int
+    """
+    cache_dir = cache_dir or _cache_dir()
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name.endswith('.pkl'):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(entry[1] for entry in entries)
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def _update_hash(sha, value, is_file=False):
+    """
+    Add a value to a hash. Arrays are hashed by data type, shape and contents.
+    Files are hashed by path, size and modification time.
+    """
+    if is_file:
+        stat = os.stat(value)
+        sha.update(repr(('file', os.path.abspath(value), stat.st_size, stat.st_mtime_ns)).encode())
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise _Unhashable
+        sha.update(repr(('ndarray', value.dtype.str, value.shape)).encode())
+        sha.update(memoryview(np.ascontiguousarray(value)).cast('B'))
+    elif isinstance(value, dict):
+        sha.update(b'dict')
+        for k in sorted(value, key=repr):
+            _update_hash(sha, k)
+            _update_hash(sha, value[k])
+    elif isinstance(value, (list, tuple)):
+        sha.update(type(value).__name__.encode())
+        for item in value:
+            _update_hash(sha, item)
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic, np.dtype, type)):
+        sha.update(repr((type(value).__name__, value)).encode())
+    else:
+        raise _Unhashable
+
+
+def _hash_code(sha, code):
+    """
+    Add the bytecode and constants of a function, and of functions defined within it, to a hash.
+    """
+    sha.update(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _hash_code(sha, const)
+        elif isinstance(const, frozenset):
+            sha.update(repr(sorted(repr(item) for item in const)).encode())
+        else:
+            sha.update(repr(const).encode())
+
+
+_package_salt = []
+
+
+def _package_hash():
+    """
+    Hash of the source of the biosig package, calculated once per process.
+    """
+    if not _package_salt:
+        sha = hashlib.blake2b(digest_size=20)
+        root = os.path.dirname(os.path.abspath(__file__))
+        for path, _, names in sorted(os.walk(root)):
+            for name in sorted(names):
+                if name.endswith('.py'):
+                    sha.update(os.path.relpath(os.path.join(path, name), root).encode())
+                    with open(os.path.join(path, name), 'rb') as infile:
+                        sha.update(infile.read())
+        _package_salt.append(sha.digest())
+    return _package_salt[0]
+
+
+def _make_key(func, bound, files):
+    sha = hashlib.blake2b(digest_size=20)
+    # Results are recomputed if the function, or any code in biosig it may call, changes.
+    sha.update(_package_hash())
+    _hash_code(sha, func.__code__)
+    for name, value in bound.arguments.items():
+        sha.update(name.encode())
+        _update_hash(sha, value, is_file=name in files)
+    if 'dtype' in bound.arguments:
+        # Result type can also depend on set_dtype.
+        _update_hash(sha, get_dtype())
+    return sha.hexdigest()
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as infile:
+            result = pickle.load(infile)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return False, None
+    # Mark result as recently used, for eviction.
+    os.utime(path)
+    return True, result
+
+
+def _save(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp{}'.format(os.getpid())
+    with open(tmp, 'wb') as outfile:
+        pickle.dump(result, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def memoize(func=None, files=()):
+    """
+    Decorate a processing function so that its results are cached on disk when memoization is enabled.
+    Results are keyed by a hash of the function (bytecode and constants), the source of the biosig package
+    and all arguments, including the contents of array arguments. Changes to other code that the function
+    calls (eg. another package, or helpers of a user's own memoized function) are not detected,
+    so call clear_memo after changing such code. Calls that show a plot, print results or write to an out array, or whose arguments
+    cannot be hashed, are not cached.
+
+    :param func: processing function
+    :type func: function
+    :param files: names of arguments that are file names, hashed by file size and modification time
+    :type files: tuple
+    :return: memoized function
+    :rtype: function
+    """
+    if func is None:
+        return lambda func: memoize(func, files=files)
+    name = _func_name(func)
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        cache_dir = _cache_dir()
+        if not cache_dir:
+            return func(*args, **kwargs)
+        try:
+            bound = signature.bind(*args, **kwargs)
+        except TypeError:
+            return func(*args, **kwargs)
+        bound.apply_defaults()
+        if bound.arguments.get('plot') or bound.arguments.get('verbose') or bound.arguments.get('out') is not None:
+            return func(*args, **kwargs)
+        try:
+            key = _make_key(func, bound, files)
+        except (_Unhashable, OSError):
+            return func(*args, **kwargs)
+        counts = _stats.setdefault(name, {'hits': 0, 'misses': 0})
+        path = os.path.join(cache_dir, name, key + '.pkl')
+        found, result = _load(path)
+        if found:
+            counts['hits'] += 1
+            return result
+        counts['misses'] += 1
+        result = func(*args, **kwargs)
+        try:
+            _save(path, result)
+            if _config['max_size'] is not None:
+                evict_memo(_config['max_size'], cache_dir)
+        except (OSError, pickle.PicklingError) as err:
+            warnings.warn('Could not cache result of {}: {}'.format(name, err))
+        return result
+
+    return wrapper
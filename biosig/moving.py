@@ -0,0 +1,129 @@
+import numpy as np
+
+
+def _window_bounds(n, halfwidth, exclude_last=False):
+    """
+    Find the start and stop indices of a centred moving window for each sample.
+    The window spans samples i - halfwidth to i + halfwidth (stop excluded)
+    and is smaller at the start and the end of the signal.
+    If exclude_last, windows of samples i > n - halfwidth (and i >= halfwidth) stop before the last sample,
+    except the window of the last sample itself.
+
+    :param n: number of samples
+    :type n: int
+    :param halfwidth: half of the window width (samples)
+    :type halfwidth: int
+    :param exclude_last: stop windows at the end of the signal before the last sample
+    :type exclude_last: bool
+    :return: start and stop indices
+    :rtype: ndarray
+    """
+    if halfwidth < 1:
+        raise ValueError('Half of the window width must be at least 1 sample, got {}'.format(halfwidth))
+    idx = np.arange(n)
+    start = np.clip(idx - halfwidth, 0, n)
+    stop = np.clip(idx + halfwidth, 0, n)
+    if exclude_last and n > 1:
+        stop[max(n - halfwidth + 1, halfwidth) : n - 1] = n - 1
+    return start, stop
+
+
+def _expand(arr, ndim, axis):
+    """
+    Reshape a 1D array of per-sample values so it broadcasts along an axis of an nD array.
+    """
+    shape = [1] * ndim
+    shape[axis] = arr.size
+    return arr.reshape(shape)
+
+
+def range_sum(data, start, stop, axis=0):
+    """
+    Calculate the sum of data between pairs of start and stop indices (stop excluded) using a cumulative sum.
+    Runs in O(n) regardless of the number or width of ranges, and ranges may overlap.
+
+    :param data: data, 1D or nD (eg. samples x channels)
+    :type data: ndarray
+    :param start: start indices
+    :type start: ndarray
+    :param stop: stop indices
+    :type stop: ndarray
+    :param axis: axis of samples
+    :type axis: int
+    :return: sum over each range, along the axis of samples
+    :rtype: ndarray
+    """
+    data = np.asarray(data, dtype=np.float64)
+    axis = axis % data.ndim
+    # Prepend a zero so that sum(data[start:stop]) = csum[stop] - csum[start].
+    pad = [(0, 0)] * data.ndim
+    pad[axis] = (1, 0)
+    csum = np.pad(np.cumsum(data, axis=axis), pad)
+    return np.take(csum, stop, axis=axis) - np.take(csum, start, axis=axis)
+
+
+def moving_sum(data, halfwidth, axis=0, exclude_last=False):
+    """
+    Calculate the sum over a centred moving window using a cumulative sum.
+    Runs in O(n) regardless of window width.
+
+    :param data: data, 1D or nD (eg. samples x channels)
+    :type data: ndarray
+    :param halfwidth: half of the window width (samples)
+    :type halfwidth: int
+    :param axis: axis along which the window moves
+    :type axis: int
+    :param exclude_last: stop windows at the end of the signal before the last sample (see calc_rms)
+    :type exclude_last: bool
+    :return: moving sum and number of samples in each window
+    :rtype: ndarray
+    """
+    data = np.asarray(data, dtype=np.float64)
+    axis = axis % data.ndim
+    start, stop = _window_bounds(data.shape[axis], halfwidth, exclude_last)
+    total = range_sum(data, start, stop, axis=axis)
+    count = _expand(stop - start, data.ndim, axis)
+    return total, count
+
+
+def moving_mean(data, halfwidth, axis=0, exclude_last=False):
+    """
+    Calculate the mean over a centred moving window.
+    Window is smaller at the start and the end of the signal.
+
+    :param data: data, 1D or nD (eg. samples x channels)
+    :type data: ndarray
+    :param halfwidth: half of the window width (samples)
+    :type halfwidth: int
+    :param axis: axis along which the window moves
+    :type axis: int
+    :param exclude_last: stop windows at the end of the signal before the last sample (see calc_rms)
+    :type exclude_last: bool
+    :return: moving mean
+    :rtype: ndarray
+    """
+    total, count = moving_sum(data, halfwidth, axis=axis, exclude_last=exclude_last)
+    return total / count
+
+
+def moving_rms(data, halfwidth, axis=0, exclude_last=False):
+    """
+    Calculate the root-mean-square over a centred moving window.
+    Window is smaller at the start and the end of the signal.
+
+    :param data: data, 1D or nD (eg. samples x channels)
+    :type data: ndarray
+    :param halfwidth: half of the window width (samples)
+    :type halfwidth: int
+    :param axis: axis along which the window moves
+    :type axis: int
+    :param exclude_last: stop windows at the end of the signal before the last sample (see calc_rms)
+    :type exclude_last: bool
+    :return: moving RMS
+    :rtype: ndarray
+    """
+    data = np.asarray(data, dtype=np.float64)
+    mean_sq = moving_mean(data ** 2, halfwidth, axis=axis, exclude_last=exclude_last)
+    # Differences of a cumulative sum can round to tiny negative values.
+    np.maximum(mean_sq, 0, out=mean_sq)
+    return np.sqrt(mean_sq)
@@ -0,0 +1,189 @@
+import csv
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+
+Stage = namedtuple('Stage', ['name', 'func', 'args', 'kwargs', 'outputs'])
+
+
+class Ref:
+    """
+    Reference to a value of a trial, resolved when the trial is run:
+    a field of the trial spec (eg. 'subject') or the output of an earlier stage.
+    A key selects an item of the value, eg. a channel of the dictionary returned by read_data.
+
+    :param name: spec field or stage output name
+    :type name: str
+    :param key: item of the value
+    :type key: str or int
+    """
+
+    def __init__(self, name, key=None):
+        self.name = name
+        self.key = key
+
+    def resolve(self, context):
+        value = context[self.name]
+        return value if self.key is None else value[self.key]
+
+    def __repr__(self):
+        return 'Ref({!r}, {!r})'.format(self.name, self.key) if self.key is not None else 'Ref({!r})'.format(self.name)
+
+
+class Format:
+    """
+    String template formatted with the values of a trial when the trial is run,
+    eg. Format('{path_raw}{subject}/{trial}.txt').
+
+    :param template: string template
+    :type template: str
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def resolve(self, context):
+        return self.template.format(**context)
+
+    def __repr__(self):
+        return 'Format({!r})'.format(self.template)
+
+
+def stage(name, func, *args, outputs=None, **kwargs):
+    """
+    Declare a stage of a processing pipeline.
+    The function is called with the arguments and keyword arguments, after any Ref or Format
+    values are resolved for the trial. The result is stored under the stage name, or, if output
+    names are given, the returned tuple is unpacked into those names.
+    Results that are numbers or strings (eg. MVC, CV, percent power) are collected in the results table.
+
+    Example:
+        stage('mvc', find_mvc, Ref('emg_rect'), outputs=('mvc_index', 'mvc_value'))
+
+    :param name: stage name
+    :type name: str
+    :param func: processing function
+    :type func: function
+    :param outputs: names of returned values
+    :type outputs: tuple
+    :return: stage
+    :rtype: Stage
+    """
+    return Stage(name, func, args, kwargs, tuple(outputs) if outputs else None)
+
+
+def _resolve(value, context):
+    return value.resolve(context) if isinstance(value, (Ref, Format)) else value
+
+
+def _is_scalar(value):
+    return isinstance(value, (int, float, str, np.generic)) or (isinstance(value, np.ndarray) and value.ndim == 0)
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, (np.generic, np.ndarray)) else value
+
+
+def _unpack(st, result):
+    """
+    Match the values returned by a stage to its output names.
+    """
+    if not isinstance(result, (tuple, list)):
+        raise ValueError('Expected {} values for outputs {}, got {}'.format(
+            len(st.outputs), st.outputs, type(result).__name__))
+    if len(result) != len(st.outputs):
+        raise ValueError('Expected {} values for outputs {}, got {}'.format(
+            len(st.outputs), st.outputs, len(result)))
+    return dict(zip(st.outputs, result))
+
+
+def run_trial(spec, stages):
+    """
+    Run processing stages on one trial.
+    An exception in a stage stops the trial, and is recorded in the results rather than raised.
+
+    :param spec: subject and trial, or dictionary of trial values including subject and trial
+    :type spec: tuple or dict
+    :param stages: processing stages
+    :type stages: list
+    :return: scalar results, and error if a stage failed
+    :rtype: dict
+    """
+    if isinstance(spec, dict):
+        context = dict(spec)
+    else:
+        context = dict(zip(('subject', 'trial'), spec))
+    row = {k: _scalar(v) for k, v in context.items() if _is_scalar(v)}
+    row['error'] = None
+    for st in stages:
+        try:
+            args = [_resolve(arg, context) for arg in st.args]
+            kwargs = {k: _resolve(v, context) for k, v in st.kwargs.items()}
+            result = st.func(*args, **kwargs)
+            results = _unpack(st, result) if st.outputs else {st.name: result}
+        except Exception as err:
+            row['error'] = '{}: {}: {}'.format(st.name, type(err).__name__, err)
+            row['traceback'] = traceback.format_exc()
+            break
+        for k, v in results.items():
+            context[k] = v
+            if _is_scalar(v):
+                row[k] = _scalar(v)
+    return row
+
+
+def run_pipeline(specs, stages, workers=None):
+    """
+    Run processing stages on many trials (eg. subject and trial combinations) across a pool of processes.
+    Each trial is processed independently, so a trial that fails does not stop the others.
+    Processing functions must be defined at module level so that they can be sent to worker processes.
+
+    Example:
+        channels = {'force':0, 'emg':1}
+        stages = [
+            stage('data', read_data, Format('{path_raw}{subject}/{trial}.txt'), channels=channels),
+            stage('emg_filt', filter_bandpass, Ref('data', 'emg'), freq=2000),
+            stage('emg_rect', rectify, Ref('emg_filt')),
+            stage('peak', find_mvc, Ref('emg_rect'), outputs=('mvc_index', 'mvc_value')),
+            stage('mvc', calc_mvc, Ref('emg_rect'), Ref('mvc_index'), Ref('mvc_value'), freq=2000, window=500),
+        ]
+        specs = [{'path_raw': path_raw, 'subject': sub, 'trial': trial} for sub in subs for trial in trials]
+        results = run_pipeline(specs, stages, workers=8)
+        write_results(results, 'results.csv')
+
+    :param specs: trials, each a tuple of subject and trial or a dictionary of trial values
+    :type specs: list
+    :param stages: processing stages
+    :type stages: list
+    :param workers: number of worker processes, number of CPUs if None, 1 to run in this process
+    :type workers: int
+    :return: results table, one dictionary of scalar results per trial in the order of specs
+    :rtype: list
+    """
+    run = partial(run_trial, stages=list(stages))
+    if workers == 1:
+        return [run(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, specs))
+
+
+def write_results(results, file):
+    """
+    Write a results table to a comma-separated text file, with one row per trial.
+
+    :param results: results table from run_pipeline
+    :type results: list
+    :param file: file name
+    :type file: str
+    """
+    columns = []
+    for row in results:
+        columns += [k for k in row if k not in columns and k != 'traceback']
+    with open(file, 'w', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
@@ -1,5 +1,65 @@
-import os, shutil
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from biosig.spectral import reduce_spectrogram
+
+
+# Traces longer than this (samples) are drawn as min/max envelopes by default.
+DECIMATE_THRESHOLD = 10000
+
+
+def decimate_minmax(data, n_columns):
+    """
+    Reduce a trace to the minimum and maximum of each of n_columns equal bins of samples.
+    Drawn as a line, the envelope looks the same as the full trace at a width of n_columns pixels,
+    but has at most 2 * n_columns vertices.
+
+    :param data: data, 1D or samples x channels
+    :type data: ndarray
+    :param n_columns: number of bins (eg. width of plot in pixels)
+    :type n_columns: int
+    :return: sample indices and values of the envelope
+    :rtype: ndarray
+    """
+    data = np.asarray(data)
+    n = data.shape[0]
+    if n <= 2 * n_columns:
+        return np.arange(n), data
+    edges = np.linspace(0, n, n_columns + 1).astype(np.int64)[:-1]
+    lo = np.minimum.reduceat(data, edges, axis=0)
+    hi = np.maximum.reduceat(data, edges, axis=0)
+    # Alternate min and max within each bin, so the line spans the full range of each column.
+    x = np.repeat(edges, 2)
+    y = np.empty((2 * n_columns,) + data.shape[1:], dtype=data.dtype)
+    y[0::2], y[1::2] = lo, hi
+    return x, y
+
+
+def plot_trace(ax, data, decimate=None, **kwargs):
+    """
+    Plot a trace against sample number, as min/max envelopes if the trace is long.
+
+    :param ax: axes
+    :type ax: matplotlib.axes.Axes
+    :param data: data, 1D or samples x channels
+    :type data: ndarray
+    :param decimate: draw min/max envelopes, automatic above DECIMATE_THRESHOLD samples if None
+    :type decimate: bool
+    :return: lines
+    :rtype: list
+    """
+    data = np.asarray(data)
+    if decimate is None:
+        decimate = data.shape[0] > DECIMATE_THRESHOLD
+    if not decimate:
+        return ax.plot(data, **kwargs)
+    fig = ax.get_figure()
+    n_columns = max(int(fig.get_figwidth() * fig.dpi), 1)
+    x, y = decimate_minmax(data, n_columns)
+    return ax.plot(x, y, **kwargs)
 
 
 def set_details(path_raw='', path_proc='', sub='', trial='', signal=''):
@@ -36,7 +96,21 @@ def set_details(path_raw='', path_proc='', sub='', trial='', signal=''):
     return details
 
 
-def save_plot(details=None, cond_type=''):
+def new_figure(**kwargs):
+    """
+    Create a figure drawn with the Agg backend, without pyplot.
+    The figure is not registered with pyplot, so it is freed when no longer referenced
+    and several figures can be drawn at the same time, eg. in worker processes.
+
+    :return: figure
+    :rtype: matplotlib.figure.Figure
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def save_plot(details=None, cond_type='', fig=None):
     """
     If testing details are passed, save plot in directory for processed data.
     Otherwise save plot in local directory.
@@ -45,22 +119,30 @@ def save_plot(details=None, cond_type=''):
     :type details: dict
 	:param cond_type: condition type (eg. raw, filt, powerspec)
     :type cond_type: str
-    :return:
-    :rtype:
+    :param fig: figure, current pyplot figure if None (closed after saving)
+    :type fig: matplotlib.figure.Figure
+    :return: file path of saved plot
+    :rtype: str
     """
+    close = fig is None
+    if close:
+        import matplotlib.pyplot as plt
+        fig = plt.gcf()
     if details and cond_type:
-        # save figure to processed data directory
-        plt.savefig(details['trial'] + '_' + details['signal'] + '_' + cond_type + '.png')
-        plt.close()
-        shutil.move(details['path_raw'] + details['sub'] + '/' + details['trial'] + '_'  + details['signal'] + '_'  + cond_type + '.png',
-                    details['path_proc'] + details['sub'] + '/' + details['trial'] + '_'  + details['signal'] + '_'  + cond_type + '.png')
+        # save figure directly to processed data directory
+        path = details['path_proc'] + details['sub']
+        os.makedirs(path, exist_ok=True)
+        file = os.path.join(path, details['trial'] + '_' + details['signal'] + '_' + cond_type + '.png')
     else:
         # save figure to local directory
-        plt.savefig('figure.png')
-        plt.close()
+        file = 'figure.png'
+    fig.savefig(file)
+    if close:
+        plt.close(fig)
+    return file
 
 
-def plot_raw(data, details=None, cond_type='raw'):
+def plot_raw(data, details=None, cond_type='raw', decimate=None):
     """
     Plot raw data.
     If testing details are passed, plot is saved in directory for processed data.
@@ -72,20 +154,21 @@ def plot_raw(data, details=None, cond_type='raw'):
     :type details: dict
 	:param cond_type: condition type
     :type cond_type: str
-    :return:
-    :rtype:
+    :param decimate: draw min/max envelopes, automatic above DECIMATE_THRESHOLD samples if None
+    :type decimate: bool
+    :return: file path of saved plot
+    :rtype: str
     """
-    plt.clf()
-    plt.close()
-    fig = plt.figure()
-    plt.plot(data)
-    plt.xlabel('Sample')
-    plt.ylabel('EMG (a.u.)')
-    plt.tight_layout()
-    save_plot(details, cond_type)
+    fig = new_figure()
+    ax = fig.add_subplot(1, 1, 1)
+    plot_trace(ax, data, decimate)
+    ax.set_xlabel('Sample')
+    ax.set_ylabel('EMG (a.u.)')
+    fig.tight_layout()
+    return save_plot(details, cond_type, fig)
 
 
-def plot_filt(data, data_filt, freq, details=None, cond_type='filt'):
+def plot_filt(data, data_filt, freq, details=None, cond_type='filt', decimate=None):
     """
     Plot filtered data: short section and full trial.
     If testing details are passed, plot is saved in directory for processed data.
@@ -101,30 +184,30 @@ def plot_filt(data, data_filt, freq, details=None, cond_type='filt'):
     :type details: dict
 	:param cond_type: condition type
     :type cond_type: str
-    :return:
-    :rtype:
+    :param decimate: draw min/max envelopes, automatic above DECIMATE_THRESHOLD samples if None
+    :type decimate: bool
+    :return: file path of saved plot
+    :rtype: str
     """
-    plt.clf()
-    fig = plt.figure()
+    fig = new_figure()
     axes1 = fig.add_subplot(2, 1, 1)
     axes1.set_ylabel('EMG (a.u.), 1 sec')
-    axes1.plot(data[0 : 1 * freq], label='raw')
-    axes1.plot(data_filt[0 : 1 * freq], label='filtered')
-    plt.locator_params(axis='x', nbins=5)
-    plt.locator_params(axis='y', nbins=5)
-    plt.axis('tight')
-    plt.legend(loc='best')
+    plot_trace(axes1, data[0 : 1 * freq], decimate, label='raw')
+    plot_trace(axes1, data_filt[0 : 1 * freq], decimate, label='filtered')
+    axes1.locator_params(axis='x', nbins=5)
+    axes1.locator_params(axis='y', nbins=5)
+    axes1.axis('tight')
+    axes1.legend(loc='best')
     axes2 = fig.add_subplot(2, 1, 2)
     axes2.set_ylabel('EMG (a.u.), full')
     axes2.set_xlabel('Sample')
-    axes2.plot(data)
-    axes2.plot(data_filt)
-    plt.locator_params(axis='x', nbins=5)
-    plt.locator_params(axis='y', nbins=5)
-    plt.axis('tight')
-    plt.tight_layout()
-    save_plot(details, cond_type)
-    plt.close()
+    plot_trace(axes2, data, decimate)
+    plot_trace(axes2, data_filt, decimate)
+    axes2.locator_params(axis='x', nbins=5)
+    axes2.locator_params(axis='y', nbins=5)
+    axes2.axis('tight')
+    fig.tight_layout()
+    return save_plot(details, cond_type, fig)
 
 
 def plot_powerspec(f, Pxx_den, lowpass, details=None, cond_type='powerspec'):
@@ -136,7 +219,6 @@ def plot_powerspec(f, Pxx_den, lowpass, details=None, cond_type='powerspec'):
 
     Example:
         import numpy as np
-        import matplotlib.pyplot as plt
         from scipy import signal
 
         x = np.random.uniform(-1, 1, size=1000)
@@ -154,33 +236,34 @@ def plot_powerspec(f, Pxx_den, lowpass, details=None, cond_type='powerspec'):
     :type details: dict
 	:param cond_type: condition type
     :type cond_type: str
-    :return:
-    :rtype:
+    :return: file path of saved plot
+    :rtype: str
     """
-    plt.clf()
-    fig = plt.figure(figsize=(11, 7))
-    plt.plot(f, Pxx_den, 'k-o')
-    plt.xlabel('Frequency [Hz]')
-    plt.ylabel('PSD [V**2/Hz]')
-    plt.xlim((1, lowpass / 2))
-    plt.ylim(0, Pxx_den.max())  # print(Pxx_den.max())
-    plt.locator_params(axis='x', nbins=5)
-    plt.locator_params(axis='y', nbins=5)
-    plt.tight_layout()
-    save_plot(details, cond_type)
-    plt.close()
+    fig = new_figure(figsize=(11, 7))
+    ax = fig.add_subplot(1, 1, 1)
+    ax.plot(f, Pxx_den, 'k-o')
+    ax.set_xlabel('Frequency [Hz]')
+    ax.set_ylabel('PSD [V**2/Hz]')
+    ax.set_xlim((1, lowpass / 2))
+    ax.set_ylim(0, Pxx_den.max())
+    ax.locator_params(axis='x', nbins=5)
+    ax.locator_params(axis='y', nbins=5)
+    fig.tight_layout()
+    return save_plot(details, cond_type, fig)
 
 
-def plot_spectrogram(f, t, Sxx, ylim_ul, xmargin, toffset=0, details=None, cond_type='specgram'):
+def plot_spectrogram(f, t, Sxx, ylim_ul, xmargin, toffset=0, details=None, cond_type='specgram', reduce=True):
     """
     Plot spectrogram of data.
-    This function requires a spectrogram analysis is first performed on the recorded signal.
+    This function requires a spectrogram analysis is first performed on the recorded signal
+    (eg. scipy.signal.spectrogram, calc_stft or calc_spectrogram).
+    Spectrograms with more segments than the plot is wide in pixels, or more frequencies below ylim_ul
+    than it is high, are averaged to the resolution of the plot before drawing (see reduce_spectrogram).
     If testing details are passed, plot is saved in directory for processed data.
     Otherwise plot is saved in local directory.
 
     Example:
         import numpy as np
-        import matplotlib.pyplot as plt
         from scipy import signal
 
         x = np.random.uniform(-1, 1, size=1000)
@@ -204,21 +287,60 @@ def plot_spectrogram(f, t, Sxx, ylim_ul, xmargin, toffset=0, details=None, cond_
     :type details: dict
     :param cond_type: condition type
     :type cond_type: str
-    :return:
-    :rtype:
+    :param reduce: average the spectrogram to the resolution of the plot
+    :type reduce: bool
+    :return: file path of saved plot
+    :rtype: str
     """
-    plt.clf()
-    fig, ax = plt.subplots(1, figsize=(11,7))
+    fig = new_figure(figsize=(11, 7))
+    ax = fig.add_subplot(1, 1, 1)
+    if reduce:
+        width, height = fig.get_size_inches() * fig.dpi
+        f, t, Sxx = reduce_spectrogram(f, t, Sxx, n_columns=int(width), n_rows=int(height), fmax=ylim_ul)
     t = t - toffset
     p = ax.pcolormesh(t, f, Sxx, cmap='RdBu', shading='gouraud')
-    fig.colorbar(p)
-    plt.ylim((0, ylim_ul))
-    plt.xlim((t - xmargin, t + xmargin))
-    plt.ylabel('Frequency [Hz]')
-    plt.xlabel('Time [sec]')
-    plt.locator_params(axis='x', nbins=5)
-    plt.locator_params(axis='y', nbins=5)
-    plt.tight_layout()
-    save_plot(details, cond_type)
-    plt.close()
+    fig.colorbar(p, ax=ax)
+    ax.set_ylim((0, ylim_ul))
+    # Event is at time 0 after removing the offset.
+    ax.set_xlim((-xmargin, xmargin))
+    ax.set_ylabel('Frequency [Hz]')
+    ax.set_xlabel('Time [sec]')
+    ax.locator_params(axis='x', nbins=5)
+    ax.locator_params(axis='y', nbins=5)
+    fig.tight_layout()
+    return save_plot(details, cond_type, fig)
+
 
+def _render(job):
+    """
+    Call a plot function with arguments, and return the file path or the error.
+    """
+    func, args, kwargs = job
+    try:
+        return func(*args, **kwargs)
+    except Exception as err:
+        return err
+
+
+def plot_batch(jobs, workers=None):
+    """
+    Draw and save many plots across a pool of processes.
+    Each plot is saved directly to its own file, so plots do not depend on the working directory
+    and do not interfere with each other. A plot that fails does not stop the others.
+
+    Example:
+        jobs = [(plot_raw, (data[sub],), {'details': details[sub]}) for sub in subs]
+        files = plot_batch(jobs, workers=8)
+
+    :param jobs: plot function, tuple of arguments and dictionary of keyword arguments for each plot
+    :type jobs: list
+    :param workers: number of worker processes, number of CPUs if None, 1 to draw in this process
+    :type workers: int
+    :return: file path of each saved plot, or the exception raised, in the order of jobs
+    :rtype: list
+    """
+    jobs = [(job[0], tuple(job[1]) if len(job) > 1 else (), dict(job[2]) if len(job) > 2 else {}) for job in jobs]
+    if workers == 1:
+        return [_render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render, jobs))
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+# Data type of processing results, None keeps the floating point type of the input data.
+_config = {'dtype': None}
+
+
+def set_dtype(dtype):
+    """
+    Set the data type of results of processing functions that accept a dtype argument
+    (eg. np.float32 to halve memory use). None keeps the floating point type of the input data,
+    and integer data are processed as float64.
+
+    Example:
+        set_dtype(np.float32)
+        data = read_data('V_L.txt', channels, dtype=np.float32)
+
+    :param dtype: data type
+    :type dtype: dtype
+    """
+    _config['dtype'] = None if dtype is None else np.dtype(dtype)
+
+
+def get_dtype():
+    """
+    Data type of results of processing functions, as set by set_dtype.
+
+    :return: data type
+    :rtype: dtype
+    """
+    return _config['dtype']
+
+
+def result_dtype(data, dtype=None):
+    """
+    Find the data type of a processing result: the dtype argument of the call, otherwise the type set
+    by set_dtype, otherwise the floating point type of the data.
+
+    :param data: data
+    :type data: ndarray
+    :param dtype: data type of the call
+    :type dtype: dtype
+    :return: data type
+    :rtype: dtype
+    """
+    if dtype is None:
+        dtype = _config['dtype']
+    if dtype is None:
+        dtype = np.asarray(data).dtype
+        return dtype if np.issubdtype(dtype, np.floating) else np.dtype(np.float64)
+    return np.dtype(dtype)
+
+
+def prepare_out(data, dtype=None, out=None):
+    """
+    Find or allocate the array that a processing result is written to.
+    An out array can be the data itself, to process in place.
+
+    :param data: data
+    :type data: ndarray
+    :param dtype: data type of the call, ignored if out is given
+    :type dtype: dtype
+    :param out: array to write result to
+    :type out: ndarray
+    :return: array to write result to
+    :rtype: ndarray
+    """
+    if out is None:
+        return np.empty(np.shape(data), dtype=result_dtype(data, dtype))
+    if out.shape != np.shape(data):
+        raise ValueError('out has shape {}, expected {}'.format(out.shape, np.shape(data)))
+    return out
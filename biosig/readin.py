@@ -1,42 +1,358 @@
 import os
+import json
+import asyncio
+import zlib
+import struct
+import hashlib
+from itertools import islice
 import numpy as np
 import warnings
 
+from biosig.memo import memoize
+from biosig.precision import prepare_out
 
-def read_data(file, channels={}):
+
+CACHE_DIRNAME = '.biosig_cache'
+CONTAINER_MAGIC = b'BIOSIG01'
+LOG_FIELDS = ('id', 'scale1', 'scale2', 'freq', 'age', 'sex', 'height', 'weight')
+FRAME_MAGIC = b'BSGF'
+FRAME_HEADER = struct.Struct('<4sIIH')
+
+
+def _find_bad_row(lines, columns, first_line=1):
+    """
+    Find the first row of a data text file that cannot be read, and describe the problem.
+
+    :param lines: rows of the data text file
+    :type lines: iterable
+    :param columns: zero-indexed columns to read
+    :type columns: list
+    :param first_line: line number of the first row
+    :type first_line: int
+    :return: line number and description, or None if all rows can be read
+    :rtype: tuple
+    """
+    for line_num, row in enumerate(lines, first_line):
+        values = row.strip('\r\n').split('\t')
+        if not row.strip():
+            continue
+        if max(columns) >= len(values):
+            return line_num, 'expected at least {} columns, found {}'.format(max(columns) + 1, len(values))
+        for col in columns:
+            try:
+                float(values[col])
+            except ValueError:
+                return line_num, 'could not convert {!r} in column {} to a number'.format(values[col], col)
+    return None
+
+
+def _parse_rows(rows, columns, dtype, file, first_line=1):
+    """
+    Parse tab-separated rows into a samples x columns array using the numpy C parser.
+    Rows that cannot be read are reported with their line number in the data text file.
+    """
+    try:
+        return np.loadtxt(rows, delimiter='\t', usecols=columns, dtype=dtype, ndmin=2, comments=None)
+    except ValueError as err:
+        if isinstance(rows, list):
+            bad = _find_bad_row(rows, columns, first_line)
+        else:
+            with open(rows, 'r') as infile:
+                bad = _find_bad_row(infile, columns, first_line)
+        if bad is None:
+            raise
+        raise ValueError('Malformed row in {}, line {}: {}'.format(file, *bad)) from err
+
+
+def read_array(file, columns, dtype=np.float64):
+    """
+    Read in columns of data from a data text file into a single array.
+    Data from each channel are stored in columns. Values are tab-separated.
+    The file is parsed once and only the nominated columns are converted.
+    Columns are zero-indexed.
+
+    Example:
+        data = read_array('V_L.txt', columns=[0, 1, 2], dtype=np.float32)
+
+    :param file: file name
+    :type file: str
+    :param columns: zero-indexed columns to read
+    :type columns: list
+    :param dtype: data type of returned values
+    :type dtype: dtype
+    :return: samples x columns array
+    :rtype: ndarray
+    """
+    return _parse_rows(file, list(columns), dtype, file)
+
+
+def iter_array(file, columns, chunksize=100000, dtype=np.float64):
+    """
+    Read in columns of data from a data text file in blocks of rows (chunks),
+    so that files larger than memory can be processed. Blocks can be passed
+    directly to chunked filters, eg. biosig.filter_bandpass_chunks.
+    Columns are zero-indexed.
+
+    Example:
+        chunks = iter_array('V_L.txt', columns=[1], chunksize=50000)
+        for chunk_filt in filter_bandpass_chunks(chunks, freq=2000):
+            ...
+
+    :param file: file name
+    :type file: str
+    :param columns: zero-indexed columns to read
+    :type columns: list
+    :param chunksize: number of rows in each block
+    :type chunksize: int
+    :param dtype: data type of returned values
+    :type dtype: dtype
+    :return: blocks of samples x columns arrays
+    :rtype: generator
+    """
+    columns = list(columns)
+    with open(file, 'r') as infile:
+        first_line = 1
+        while True:
+            lines = list(islice(infile, chunksize))
+            if not lines:
+                break
+            block = _parse_rows(lines, columns, dtype, file, first_line)
+            first_line += len(lines)
+            if block.size:
+                yield block
+
+
+def _split_channels(block, channels):
+    """
+    Split a samples x columns array into a dictionary of contiguous channel arrays.
+    """
+    block = np.ascontiguousarray(block.T)
+    return {k: block[i] for i, k in enumerate(channels)}
+
+
+def _hash_file(file, blocksize=1 << 20):
+    """
+    Calculate the SHA-1 hash of the contents of a file.
+    """
+    sha = hashlib.sha1()
+    with open(file, 'rb') as infile:
+        for block in iter(lambda: infile.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _cache_paths(file, columns, dtype, cache_dir=None):
+    """
+    Find the binary and metadata paths of the cache entry for nominated columns of a data text file.
+    By default, the cache directory is next to the data text file.
+    """
+    source = os.path.abspath(file)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(source), CACHE_DIRNAME)
+    key = '{}|{}|{}'.format(source, list(columns), np.dtype(dtype).str)
+    name = '{}-{}'.format(os.path.basename(source), hashlib.sha1(key.encode()).hexdigest()[:16])
+    base = os.path.join(cache_dir, name)
+    return base + '.npy', base + '.json'
+
+
+def _read_cache(file, paths):
+    """
+    Open a cache entry as a read-only memory-mapped array, or return None if it is missing or stale.
+    The entry is stale when the size, modification time or contents of the data text file have changed.
+    """
+    path_npy, path_meta = paths
+    try:
+        with open(path_meta, 'r') as infile:
+            meta = json.load(infile)
+        stat = os.stat(file)
+    except (OSError, ValueError):
+        return None
+    if stat.st_size != meta['size']:
+        return None
+    if stat.st_mtime_ns != meta['mtime_ns']:
+        # File was touched, only reuse the entry if its contents are unchanged.
+        if _hash_file(file) != meta['sha1']:
+            return None
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_json(path_meta, meta)
+    try:
+        block = np.load(path_npy, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    # Mark entry as recently used, for eviction.
+    os.utime(path_npy)
+    return block
+
+
+def _write_json(path, meta):
+    tmp = path + '.tmp{}'.format(os.getpid())
+    with open(tmp, 'w') as outfile:
+        json.dump(meta, outfile)
+    os.replace(tmp, path)
+
+
+def _write_cache(file, paths, block):
+    """
+    Write a columns x samples array to a cache entry.
+    Files are written under temporary names then renamed, so readers never see a partial entry.
+    """
+    path_npy, path_meta = paths
+    os.makedirs(os.path.dirname(path_npy), exist_ok=True)
+    stat = os.stat(file)
+    meta = {'source': os.path.abspath(file), 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns, 'sha1': _hash_file(file)}
+    tmp = path_npy + '.tmp{}'.format(os.getpid())
+    with open(tmp, 'wb') as outfile:
+        np.save(outfile, block)
+    os.replace(tmp, path_npy)
+    _write_json(path_meta, meta)
+
+
+def evict_cache(cache_dir, max_size, keep=()):
+    """
+    Delete least recently used cache entries until the cache directory is no larger than max_size.
+
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :param max_size: maximum total size of cache entries (bytes)
+    :type max_size: int
+    :param keep: binary paths of cache entries that must not be deleted
+    :type keep: tuple
+    :return: number of entries deleted
+    :rtype: int
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npy'):
+            path_npy = os.path.join(cache_dir, name)
+            path_meta = path_npy[:-len('.npy')] + '.json'
+            try:
+                stat = os.stat(path_npy)
+                size = stat.st_size + (os.path.getsize(path_meta) if os.path.exists(path_meta) else 0)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, size, path_npy, path_meta))
+    total = sum(entry[1] for entry in entries)
+    deleted = 0
+    for _, size, path_npy, path_meta in sorted(entries):
+        if total <= max_size:
+            break
+        if path_npy in keep:
+            continue
+        for path in (path_meta, path_npy):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def clear_cache(file=None, cache_dir=None):
+    """
+    Delete all cache entries in a cache directory.
+    Nominate either a data text file, to clear the cache directory next to it, or the cache directory.
+
+    :param file: file name
+    :type file: str
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :return: number of entries deleted
+    :rtype: int
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file)), CACHE_DIRNAME)
+    if not os.path.isdir(cache_dir):
+        return 0
+    return evict_cache(cache_dir, 0)
+
+
+@memoize(files=('file',))
+def read_data(file, channels={}, dtype=np.float64, cache=False, cache_dir=None, cache_size=None):
     """
     Read in data from a data text file.
     Data from each channel are stored in columns. Values are tab-separated.
     The function requires a dictionary of channel keys and values to be specified.
     Channel columns are zero-indexed.
+    The file is parsed once and only the nominated channel columns are converted.
+
+    If cache is True, channels are saved to a binary cache the first time the file is read
+    (by default in a directory next to the file). Later reads return read-only memory-mapped
+    arrays without parsing the file. The cache is refreshed if the size, modification time or
+    contents of the file change.
 
     Example:
         channels = {'force':0, 'emg':1, 'distance':2}
         data = read_data('V_L.txt', channel=channels)
+        data = read_data('V_L.txt', channel=channels, cache=True, cache_size=10 * 2**30)
 
     :param file: file name
     :type file: str
     :param channels: dictionary of channel keys and values
     :type channels: dict
+    :param dtype: data type of returned values
+    :type dtype: dtype
+    :param cache: read from and save to binary cache
+    :type cache: bool
+    :param cache_dir: cache directory, next to the file if None
+    :type cache_dir: str
+    :param cache_size: maximum total size of cache directory (bytes), least recently used entries are deleted
+    :type cache_size: int
     :return: dictionary of channel keys and values
     :rtype: dict
     """
-    infile = open(file, 'r')
-    lines = infile.readlines()
-    infile.close()
-    data_list = [row.strip().split('\t') for row in lines]
-    data_dict = {}
     if channels:
-        for k,v in channels.items():
-            data_dict[k] = np.array([float(row[v]) for row in data_list])
-        # update dictionary to return free variables in function block using keys
-        locals().update(data_dict)
-        return data_dict
+        if not cache:
+            block = read_array(file, channels.values(), dtype=dtype)
+            return _split_channels(block, channels)
+        paths = _cache_paths(file, channels.values(), dtype, cache_dir)
+        block = _read_cache(file, paths)
+        if block is None:
+            block = np.ascontiguousarray(read_array(file, channels.values(), dtype=dtype).T)
+            try:
+                _write_cache(file, paths, block)
+                if cache_size is not None:
+                    evict_cache(os.path.dirname(paths[0]), cache_size, keep=(paths[0],))
+            except OSError as err:
+                warnings.warn('Could not write cache for {}: {}'.format(file, err))
+            else:
+                block = np.load(paths[0], mmap_mode='r')
+        return {k: block[i] for i, k in enumerate(channels)}
     else:
         warnings.warn('Dictionary of channel keys and values was not specified')
         pass
 
 
+def iter_data(file, channels={}, chunksize=100000, dtype=np.float64):
+    """
+    Read in data from a data text file in blocks of rows (chunks),
+    so that files larger than memory can be processed.
+    Channel columns are zero-indexed.
+
+    Example:
+        channels = {'force':0, 'emg':1, 'distance':2}
+        for data in iter_data('V_L.txt', channels, chunksize=50000):
+            emg = data['emg']
+
+    :param file: file name
+    :type file: str
+    :param channels: dictionary of channel keys and values
+    :type channels: dict
+    :param chunksize: number of rows in each block
+    :type chunksize: int
+    :param dtype: data type of returned values
+    :type dtype: dtype
+    :return: dictionaries of channel keys and blocks of values
+    :rtype: generator
+    """
+    if not channels:
+        warnings.warn('Dictionary of channel keys and values was not specified')
+        return
+    for block in iter_array(file, channels.values(), chunksize=chunksize, dtype=dtype):
+        yield _split_channels(block, channels)
+
+
 def make_time(freq, var):
     """
     Create time (sec) based on sampling rate.
@@ -87,19 +403,678 @@ def read_log(file):
     return id, scale1, scale2, freq, age, sex, height, weight
 
 
-def calibrate(data, scale, offset):
+def calibrate(data, scale, offset, dtype=None, out=None):
     """
     Remove offset and calibrate raw voltage to meaningful values.
+    A Recording is returned as a Recording, with one scale and offset for all channels or per channel.
 
-    :param data: uncalibrated data
-    :type data: ndarray
-    :param scale: calibration scale
-    :type scale: float
-    :param offset: calibration offset
-    :type offset: float
+    :param data: uncalibrated data, or Recording
+    :type data: ndarray or Recording
+    :param scale: calibration scale, or one scale per channel
+    :type scale: float or ndarray
+    :param offset: calibration offset, or one offset per channel
+    :type offset: float or ndarray
+    :param dtype: data type of result, see set_dtype
+    :type dtype: dtype
+    :param out: array to write result to, can be data to process in place
+    :type out: ndarray
     :return: calibrated data
-    :rtype: ndarray
+    :rtype: ndarray or Recording
     """
-    data = (data - offset) * scale
+    # Imported here, as biosig.recording reads files with this module.
+    from biosig.recording import Recording
+    if isinstance(data, Recording):
+        out = out.data if isinstance(out, Recording) else out
+        return data._new(calibrate(data.data, scale, offset, dtype, out))
+    data = np.subtract(data, offset, out=prepare_out(data, dtype, out), casting='same_kind')
+    data *= scale
     return data
 
+
+def _shuffle(block):
+    """
+    Group bytes of equal significance together, which improves compression of floating point values.
+    """
+    raw = np.ascontiguousarray(block).view(np.uint8).reshape(-1, block.dtype.itemsize)
+    return np.ascontiguousarray(raw.T).tobytes()
+
+
+def _unshuffle(buffer, dtype, shape):
+    itemsize = np.dtype(dtype).itemsize
+    raw = np.frombuffer(buffer, dtype=np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(raw.T).view(dtype).reshape(shape)
+
+
+class ContainerWriter:
+    """
+    Write channels of a recording to a chunked, compressed container file.
+    Samples are stored in blocks (chunks) of rows that are compressed separately,
+    with an index of chunks so that a time range can be read without reading the full file.
+    Sampling rate and metadata (eg. values from read_log) are stored with the data.
+
+    Example:
+        with ContainerWriter('V_L.bsig', ['force', 'emg'], freq=2000, meta={'id': '01'}) as writer:
+            for block in iter_array('V_L.txt', columns=[0, 1]):
+                writer.write(block)
+
+    :param file: container file name
+    :type file: str
+    :param channels: channel names, in column order
+    :type channels: list
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param meta: metadata, values must be numbers or strings
+    :type meta: dict
+    :param chunksize: number of samples in each chunk
+    :type chunksize: int
+    :param dtype: data type of stored values
+    :type dtype: dtype
+    :param level: zlib compression level (0-9)
+    :type level: int
+    """
+
+    def __init__(self, file, channels, freq, meta=None, chunksize=65536, dtype=np.float64, level=6):
+        self.file = file
+        self.channels = list(channels)
+        self.freq = freq
+        self.meta = dict(meta) if meta else {}
+        self.chunksize = int(chunksize)
+        self.dtype = np.dtype(dtype)
+        self.level = level
+        self._index = []
+        self._buffer = []
+        self._buffered = 0
+        self._outfile = open(file, 'wb')
+        self._outfile.write(CONTAINER_MAGIC)
+
+    def _write_chunk(self, chunk):
+        data = zlib.compress(_shuffle(chunk), self.level)
+        self._index.append([self._outfile.tell(), len(data), chunk.shape[0]])
+        self._outfile.write(data)
+
+    def write(self, block):
+        """
+        Add samples to the container.
+
+        :param block: samples x channels array, or 1D array for a single channel
+        :type block: ndarray
+        """
+        block = np.asarray(block, dtype=self.dtype)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        if block.shape[1] != len(self.channels):
+            raise ValueError('Expected {} channels, got {}'.format(len(self.channels), block.shape[1]))
+        self._buffer.append(block)
+        self._buffered += block.shape[0]
+        if self._buffered < self.chunksize:
+            return
+        block = np.concatenate(self._buffer)
+        n_full = block.shape[0] // self.chunksize * self.chunksize
+        for i in range(0, n_full, self.chunksize):
+            self._write_chunk(block[i : i + self.chunksize])
+        self._buffer = [block[n_full:]]
+        self._buffered = block.shape[0] - n_full
+
+    def close(self):
+        """
+        Write remaining samples and the chunk index, then close the file.
+        """
+        if self._outfile.closed:
+            return
+        if self._buffered:
+            self._write_chunk(np.concatenate(self._buffer))
+        footer = {'channels': self.channels, 'freq': self.freq, 'meta': self.meta,
+                  'dtype': self.dtype.str, 'chunksize': self.chunksize, 'index': self._index}
+        footer = json.dumps(footer, default=lambda obj: obj.item()).encode()
+        self._outfile.write(footer)
+        self._outfile.write(struct.pack('<Q', len(footer)) + CONTAINER_MAGIC)
+        self._outfile.close()
+
+    def abort(self):
+        """
+        Close and delete an incomplete container file, eg. when conversion fails.
+        """
+        if self._outfile.closed:
+            return
+        self._outfile.close()
+        os.remove(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # A failed recording must not look complete, so no footer is written.
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ContainerReader:
+    """
+    Read channels of a recording from a chunked, compressed container file.
+    Only the chunks that overlap the requested samples are read and decompressed.
+
+    Example:
+        with ContainerReader('V_L.bsig') as reader:
+            data = reader.read(start=10.0, stop=12.5, channels=['emg'])
+            freq, meta = reader.freq, reader.meta
+
+    :param file: container file name
+    :type file: str
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self._infile = open(file, 'rb')
+        if self._infile.read(len(CONTAINER_MAGIC)) != CONTAINER_MAGIC:
+            self._infile.close()
+            raise ValueError('{} is not a biosig container file'.format(file))
+        tail = len(CONTAINER_MAGIC) + 8
+        self._infile.seek(-tail, os.SEEK_END)
+        footer_len, magic = struct.unpack('<Q8s', self._infile.read(tail))
+        if magic != CONTAINER_MAGIC:
+            self._infile.close()
+            raise ValueError('{} is incomplete, the container was not closed'.format(file))
+        self._infile.seek(-(tail + footer_len), os.SEEK_END)
+        footer = json.loads(self._infile.read(footer_len).decode())
+        self.channels = footer['channels']
+        self.freq = footer['freq']
+        self.meta = footer['meta']
+        self.dtype = np.dtype(footer['dtype'])
+        self._index = np.array(footer['index'], dtype=np.int64).reshape(-1, 3)
+        # Sample at which each chunk starts, and total number of samples.
+        self._bounds = np.concatenate(([0], np.cumsum(self._index[:, 2])))
+        self.n_samples = int(self._bounds[-1])
+
+    def _read_chunk(self, i):
+        offset, nbytes, n_rows = self._index[i]
+        self._infile.seek(offset)
+        buffer = zlib.decompress(self._infile.read(nbytes))
+        return _unshuffle(buffer, self.dtype, (n_rows, len(self.channels)))
+
+    def read_samples(self, start=0, stop=None, channels=None):
+        """
+        Read a range of samples.
+
+        :param start: first sample
+        :type start: int
+        :param stop: sample after the last sample, end of recording if None
+        :type stop: int
+        :param channels: channel names, all channels if None
+        :type channels: list
+        :return: dictionary of channel keys and values
+        :rtype: dict
+        """
+        stop = self.n_samples if stop is None else min(int(stop), self.n_samples)
+        start = max(int(start), 0)
+        stop = max(stop, start)
+        channels = self.channels if channels is None else list(channels)
+        cols = [self.channels.index(k) for k in channels]
+        first = int(np.searchsorted(self._bounds, start, side='right')) - 1
+        last = int(np.searchsorted(self._bounds, stop, side='left'))
+        block = np.empty((len(cols), stop - start), dtype=self.dtype)
+        for i in range(max(first, 0), min(last, len(self._index))):
+            chunk = self._read_chunk(i)
+            lo, hi = max(start, self._bounds[i]), min(stop, self._bounds[i + 1])
+            block[:, lo - start : hi - start] = chunk[lo - self._bounds[i] : hi - self._bounds[i], cols].T
+        return {k: block[j] for j, k in enumerate(channels)}
+
+    def read(self, start=None, stop=None, channels=None):
+        """
+        Read a range of time.
+
+        :param start: start time (sec), start of recording if None
+        :type start: float
+        :param stop: stop time (sec), end of recording if None
+        :type stop: float
+        :param channels: channel names, all channels if None
+        :type channels: list
+        :return: dictionary of channel keys and values
+        :rtype: dict
+        """
+        start = 0 if start is None else round(start * self.freq)
+        stop = None if stop is None else round(stop * self.freq)
+        return self.read_samples(start, stop, channels)
+
+    def close(self):
+        self._infile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_container(file, data, freq, meta=None, chunksize=65536, dtype=np.float64):
+    """
+    Write a dictionary of channels to a chunked, compressed container file.
+
+    Example:
+        data = read_data('V_L.txt', channels={'force':0, 'emg':1})
+        write_container('V_L.bsig', data, freq=2000)
+
+    :param file: container file name
+    :type file: str
+    :param data: dictionary of channel keys and values, of equal length
+    :type data: dict
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param meta: metadata, values must be numbers or strings
+    :type meta: dict
+    :param chunksize: number of samples in each chunk
+    :type chunksize: int
+    :param dtype: data type of stored values
+    :type dtype: dtype
+    """
+    with ContainerWriter(file, data.keys(), freq, meta, chunksize, dtype) as writer:
+        writer.write(np.column_stack(list(data.values())))
+
+
+def read_container(file, start=None, stop=None, channels=None):
+    """
+    Read a range of time from a chunked, compressed container file.
+
+    Example:
+        data, freq, meta = read_container('V_L.bsig', start=10.0, stop=12.5)
+
+    :param file: container file name
+    :type file: str
+    :param start: start time (sec), start of recording if None
+    :type start: float
+    :param stop: stop time (sec), end of recording if None
+    :type stop: float
+    :param channels: channel names, all channels if None
+    :type channels: list
+    :return: dictionary of channel keys and values, sampling rate (Hz), metadata
+    :rtype: dict, int, dict
+    """
+    with ContainerReader(file) as reader:
+        data = reader.read(start, stop, channels)
+        return data, reader.freq, reader.meta
+
+
+def convert_text(file, file_out, channels, freq=None, log=None, chunksize=65536, dtype=np.float64):
+    """
+    Convert a data text file to a chunked, compressed container file.
+    The text file is read in blocks, so files larger than memory can be converted.
+    If a log file is nominated, values from read_log are stored as metadata
+    and the sampling rate is taken from the log file unless specified.
+
+    Example:
+        channels = {'force':0, 'emg':1, 'distance':2}
+        convert_text('V_L.txt', 'V_L.bsig', channels, log='log.txt')
+
+    :param file: data text file name
+    :type file: str
+    :param file_out: container file name
+    :type file_out: str
+    :param channels: dictionary of channel keys and values
+    :type channels: dict
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param log: log text file name
+    :type log: str
+    :param chunksize: number of samples in each chunk
+    :type chunksize: int
+    :param dtype: data type of stored values
+    :type dtype: dtype
+    """
+    meta = dict(zip(LOG_FIELDS, read_log(log))) if log else {}
+    if freq is None:
+        if 'freq' not in meta:
+            raise ValueError('Sampling rate was not specified and no log file was nominated')
+        freq = meta['freq']
+    with ContainerWriter(file_out, channels.keys(), freq, meta, chunksize, dtype) as writer:
+        for block in iter_array(file, channels.values(), chunksize=chunksize, dtype=dtype):
+            writer.write(block)
+
+
+def encode_frame(block, seq=0, dtype='<i2'):
+    """
+    Encode a block of samples as a binary frame for streaming acquisition (see AcquisitionStream).
+    A frame is a header (FRAME_MAGIC, sequence number, number of samples and number of channels,
+    little-endian) followed by the samples, interleaved by channel, as values of dtype.
+    A frame with no samples marks the end of a datagram stream.
+
+    :param block: samples x channels array, or 1D array for a single channel
+    :type block: ndarray
+    :param seq: sequence number of the frame
+    :type seq: int
+    :param dtype: data type of values in the frame
+    :type dtype: dtype
+    :return: frame
+    :rtype: bytes
+    """
+    block = np.asarray(block)
+    if block.ndim == 1:
+        block = block[:, np.newaxis]
+    header = FRAME_HEADER.pack(FRAME_MAGIC, seq & 0xFFFFFFFF, block.shape[0], block.shape[1])
+    return header + np.ascontiguousarray(block, dtype=dtype).tobytes()
+
+
+def _parse_header(header, dtype):
+    """
+    Find the sequence number, shape and payload size of a frame from its header.
+    """
+    magic, seq, n_samples, n_channels = FRAME_HEADER.unpack_from(header)
+    if magic != FRAME_MAGIC:
+        raise ValueError('Frame does not start with {!r}'.format(FRAME_MAGIC))
+    return seq, (n_samples, n_channels), n_samples * n_channels * np.dtype(dtype).itemsize
+
+
+def decode_frame(frame, dtype='<i2'):
+    """
+    Decode a binary frame (see encode_frame) into a samples x channels array, without copying.
+
+    :param frame: frame
+    :type frame: bytes
+    :param dtype: data type of values in the frame
+    :type dtype: dtype
+    :return: sequence number and samples x channels array
+    :rtype: tuple
+    """
+    seq, shape, size = _parse_header(frame, dtype)
+    payload = memoryview(frame)[FRAME_HEADER.size:]
+    if len(payload) != size:
+        raise ValueError('Frame {} has {} bytes of samples, expected {}'.format(seq, len(payload), size))
+    return seq, np.frombuffer(payload, dtype=dtype).reshape(shape)
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    """
+    Pass datagrams to a stream, and signal the end of the stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        self.last = loop.time()
+
+    def datagram_received(self, data, addr):
+        if self.done.done():
+            return
+        self.last = asyncio.get_running_loop().time()
+        try:
+            seq, block = decode_frame(data, self.stream.dtype)
+            if not block.shape[0]:
+                self.done.set_result(None)
+                return
+            self.stream._publish_nowait(self.stream._convert(seq, block))
+        except ValueError as err:
+            self.done.set_exception(err)
+
+    def error_received(self, exc):
+        if not self.done.done():
+            self.done.set_exception(exc)
+
+
+class AcquisitionStream:
+    """
+    Read blocks of samples streamed by an acquisition device over a local socket, with asyncio.
+    Each binary frame (see encode_frame) is decoded into arrays in one step, calibrated
+    (see calibrate) and split into a dictionary of channels, as returned by read_data.
+    Blocks are passed to consumers through bounded queues, ended by None.
+
+    Over TCP, reading waits while any queue is full (back-pressure), so a slow consumer
+    slows the device rather than using more memory. Datagrams (UDP) cannot be held back,
+    so blocks that do not fit in a full queue are dropped and counted in n_dropped.
+    Frames missing from the sequence (eg. lost datagrams) are counted in n_lost.
+    A datagram stream also ends if no datagram arrives for timeout seconds, as the empty frame
+    that ends it can be lost. A TCP stream that is idle for timeout seconds raises asyncio.TimeoutError.
+    Several devices can be read concurrently in one process, one stream per device.
+
+    Example:
+        channels = {'force':0, 'emg':1}
+        stream = AcquisitionStream('127.0.0.1', 5000, channels, scale=[scale1, 1.0], offset=[0.02, 0])
+        async for block in stream.blocks():
+            feedback = proc.process(block['emg'])
+
+        # several devices and consumers
+        queue1, queue2 = stream1.subscribe(), stream2.subscribe()
+        await asyncio.gather(stream1.run(), stream2.run(), consume(queue1), consume(queue2))
+
+    :param host: host name or address (for UDP, the local address to listen on)
+    :type host: str
+    :param port: port
+    :type port: int
+    :param channels: dictionary of channel keys and columns in the frame
+    :type channels: dict
+    :param scale: calibration scale, or one scale per channel
+    :type scale: float or list
+    :param offset: calibration offset, or one offset per channel
+    :type offset: float or list
+    :param dtype: data type of values in each frame
+    :type dtype: dtype
+    :param protocol: tcp or udp
+    :type protocol: str
+    :param maxsize: number of blocks each queue holds
+    :type maxsize: int
+    :param timeout: time without data before the stream ends (sec), no limit if None
+    :type timeout: float
+    """
+
+    def __init__(self, host, port, channels, scale=1.0, offset=0.0, dtype='<i2', protocol='tcp', maxsize=16,
+                 timeout=5.0):
+        if protocol not in ('tcp', 'udp'):
+            raise ValueError("Expected protocol 'tcp' or 'udp', got {!r}".format(protocol))
+        self.host = host
+        self.port = port
+        self.channels = dict(channels)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+        self.protocol = protocol
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.queues = []
+        self.n_blocks = 0
+        self.n_lost = 0
+        self.n_dropped = 0
+        self._columns = list(self.channels.values())
+        self._seq = None
+
+    def subscribe(self, maxsize=None):
+        """
+        Add a consumer. Every consumer receives every block.
+
+        :param maxsize: number of blocks the queue holds, maxsize of the stream if None
+        :type maxsize: int
+        :return: queue of blocks, ended by None
+        :rtype: asyncio.Queue
+        """
+        queue = asyncio.Queue(maxsize=self.maxsize if maxsize is None else maxsize)
+        self.queues.append(queue)
+        return queue
+
+    def _convert(self, seq, block):
+        """
+        Calibrate a decoded frame and split it into channels.
+        """
+        step = (seq - self._seq) & 0xFFFFFFFF if self._seq is not None else 1
+        # Late or repeated datagrams are not a gap, and do not move the sequence back.
+        if 0 < step < 0x80000000:
+            self.n_lost += step - 1
+            self._seq = seq
+        self.n_blocks += 1
+        block = calibrate(block[:, self._columns], self.scale, self.offset, dtype=np.float64)
+        return _split_channels(block, self.channels)
+
+    async def _publish(self, block):
+        for queue in self.queues:
+            await queue.put(block)
+
+    def _publish_nowait(self, block):
+        for queue in self.queues:
+            try:
+                queue.put_nowait(block)
+            except asyncio.QueueFull:
+                self.n_dropped += 1
+
+    async def _run_tcp(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while True:
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), self.timeout)
+                except asyncio.IncompleteReadError as err:
+                    if err.partial:
+                        raise ValueError('Stream ended within a frame header')
+                    break
+                seq, shape, size = _parse_header(header, self.dtype)
+                payload = await asyncio.wait_for(reader.readexactly(size), self.timeout)
+                block = np.frombuffer(payload, dtype=self.dtype).reshape(shape)
+                await self._publish(self._convert(seq, block))
+        finally:
+            writer.close()
+
+    async def _run_udp(self):
+        loop = asyncio.get_running_loop()
+        transport, receiver = await loop.create_datagram_endpoint(
+            lambda: _DatagramReceiver(self), local_addr=(self.host, self.port))
+        try:
+            while True:
+                if self.timeout is None:
+                    await receiver.done
+                    break
+                try:
+                    remaining = self.timeout - (loop.time() - receiver.last)
+                    await asyncio.wait_for(asyncio.shield(receiver.done), max(remaining, 0))
+                    break
+                except asyncio.TimeoutError:
+                    if loop.time() - receiver.last >= self.timeout:
+                        break
+        finally:
+            transport.close()
+
+    async def _end(self):
+        for queue in self.queues:
+            await queue.put(None)
+
+    async def run(self):
+        """
+        Read blocks until the device closes the connection (TCP) or sends an empty frame (UDP),
+        then put None in each queue.
+        """
+        try:
+            await (self._run_tcp() if self.protocol == 'tcp' else self._run_udp())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await self._end()
+            raise
+        await self._end()
+
+    async def blocks(self):
+        """
+        Read the stream, as an asynchronous iterator of blocks for a single consumer.
+
+        :return: dictionary of channel keys and values for each block
+        :rtype: async iterator
+        """
+        queue = self.subscribe()
+        task = asyncio.ensure_future(self.run())
+        try:
+            while True:
+                block = await queue.get()
+                if block is None:
+                    break
+                yield block
+            await task
+        finally:
+            self.queues.remove(queue)
+            if not task.done():
+                task.cancel()
+
+
+async def _send_frames(data, freq, blocksize, dtype, realtime, send):
+    """
+    Send data as frames, at the sampling rate if realtime.
+    """
+    loop = asyncio.get_running_loop()
+    t_start = loop.time()
+    for seq, start in enumerate(range(0, len(data), blocksize)):
+        stop = min(start + blocksize, len(data))
+        await send(encode_frame(data[start:stop], seq, dtype))
+        if realtime:
+            await asyncio.sleep(max(t_start + stop / freq - loop.time(), 0))
+
+
+async def start_simulator(data, freq, host='127.0.0.1', port=0, blocksize=100, dtype='<i2', realtime=True):
+    """
+    Start a local TCP server that streams a recording as an acquisition device does (see AcquisitionStream),
+    eg. for testing. Each client receives the full recording, then the connection is closed.
+
+    Example:
+        server = await start_simulator(data, freq=2000)
+        port = server.sockets[0].getsockname()[1]
+        stream = AcquisitionStream('127.0.0.1', port, channels)
+
+    :param data: samples x channels array of raw values
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param host: host name or address
+    :type host: str
+    :param port: port, any free port if 0
+    :type port: int
+    :param blocksize: number of samples in each frame
+    :type blocksize: int
+    :param dtype: data type of values in each frame
+    :type dtype: dtype
+    :param realtime: send frames at the sampling rate, otherwise as fast as possible
+    :type realtime: bool
+    :return: server
+    :rtype: asyncio.Server
+    """
+    async def handle(reader, writer):
+        async def send(frame):
+            writer.write(frame)
+            await writer.drain()
+        try:
+            await _send_frames(data, freq, blocksize, dtype, realtime, send)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def simulate_udp(data, freq, host='127.0.0.1', port=5000, blocksize=100, dtype='<i2', realtime=True):
+    """
+    Stream a recording as datagrams to a local address, as an acquisition device does
+    (see AcquisitionStream), then send an empty frame to end the stream.
+    Each frame must fit in a datagram (at most 65507 bytes).
+
+    :param data: samples x channels array of raw values
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param host: host name or address of the receiver
+    :type host: str
+    :param port: port of the receiver
+    :type port: int
+    :param blocksize: number of samples in each frame
+    :type blocksize: int
+    :param dtype: data type of values in each frame
+    :type dtype: dtype
+    :param realtime: send frames at the sampling rate, otherwise as fast as possible
+    :type realtime: bool
+    """
+    data = np.asarray(data)
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+
+    async def send(frame):
+        transport.sendto(frame)
+        # Let a receiver in the same event loop read the datagram.
+        await asyncio.sleep(0)
+
+    try:
+        await _send_frames(data, freq, blocksize, dtype, realtime, send)
+        transport.sendto(encode_frame(data[:0], 0, dtype))
+    finally:
+        transport.close()
@@ -0,0 +1,260 @@
+import inspect
+from functools import wraps
+
+import numpy as np
+
+from biosig.readin import read_array, read_log, ContainerReader, LOG_FIELDS
+
+
+class Recording:
+    """
+    Channels of a recording stored as columns of a single samples x channels array,
+    with the sampling rate and metadata (eg. calibration values from read_log).
+    Time is not stored, it is calculated from the sampling rate when needed.
+
+    Indexing with a channel name returns a view of that column. Indexing with a slice of samples
+    returns a recording that is a view of those rows, with time starting at the first selected sample.
+
+    Example:
+        channels = {'force':0, 'emg':1, 'distance':2}
+        rec = Recording.from_file('V_L.txt', channels, log='log.txt')
+        rec.calibrate('force', rec.meta['scale1'], offset=0.02)
+        emg = rec['emg']
+        part = rec.between(10.0, 12.5)
+        emg_filt = filter_bandpass(part.select(['emg']))
+
+    :param data: samples x channels array, or 1D array for a single channel
+    :type data: ndarray
+    :param channels: channel names, in column order
+    :type channels: list
+    :param freq: sampling rate (Hz)
+    :type freq: float
+    :param t0: time of the first sample (sec)
+    :type t0: float
+    :param meta: metadata
+    :type meta: dict
+    """
+
+    __slots__ = ('data', 'channels', 'freq', 't0', 'meta', '_columns')
+
+    def __init__(self, data, channels, freq, t0=0.0, meta=None):
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, np.newaxis]
+        channels = tuple(channels)
+        if data.ndim != 2 or data.shape[1] != len(channels):
+            raise ValueError('Expected samples x {} channels array, got shape {}'.format(len(channels), data.shape))
+        self.data = data
+        self.channels = channels
+        self.freq = freq
+        self.t0 = t0
+        self.meta = meta if meta is not None else {}
+        self._columns = {k: i for i, k in enumerate(channels)}
+
+    @classmethod
+    def from_file(cls, file, channels, freq=None, log=None, dtype=np.float64):
+        """
+        Read in a recording from a data text file, parsing the file once into a single array.
+        If a log file is nominated, values from read_log are stored as metadata
+        and the sampling rate is taken from the log file unless specified.
+
+        :param file: file name
+        :type file: str
+        :param channels: dictionary of channel keys and values, as for read_data
+        :type channels: dict
+        :param freq: sampling rate (Hz)
+        :type freq: float
+        :param log: log text file name
+        :type log: str
+        :param dtype: data type of values
+        :type dtype: dtype
+        :return: recording
+        :rtype: Recording
+        """
+        meta = dict(zip(LOG_FIELDS, read_log(log))) if log else {}
+        if freq is None:
+            if 'freq' not in meta:
+                raise ValueError('Sampling rate was not specified and no log file was nominated')
+            freq = meta['freq']
+        return cls(read_array(file, channels.values(), dtype=dtype), channels.keys(), freq, meta=meta)
+
+    @classmethod
+    def from_dict(cls, data, freq, meta=None):
+        """
+        Create a recording from a dictionary of channel arrays, eg. as returned by read_data.
+
+        :param data: dictionary of channel keys and values, of equal length
+        :type data: dict
+        :param freq: sampling rate (Hz)
+        :type freq: float
+        :param meta: metadata
+        :type meta: dict
+        :return: recording
+        :rtype: Recording
+        """
+        return cls(np.column_stack(list(data.values())), data.keys(), freq, meta=meta)
+
+    @classmethod
+    def from_container(cls, file, start=None, stop=None, channels=None):
+        """
+        Read in a range of time of a recording from a container file (see ContainerWriter).
+
+        :param file: container file name
+        :type file: str
+        :param start: start time (sec), start of recording if None
+        :type start: float
+        :param stop: stop time (sec), end of recording if None
+        :type stop: float
+        :param channels: channel names, all channels if None
+        :type channels: list
+        :return: recording
+        :rtype: Recording
+        """
+        with ContainerReader(file) as reader:
+            data = reader.read(start, stop, channels)
+            t0 = 0.0 if start is None else max(round(start * reader.freq), 0) / reader.freq
+            return cls(np.column_stack(list(data.values())), data.keys(), reader.freq, t0, reader.meta)
+
+    def _new(self, data, freq=None, t0=None, channels=None):
+        return Recording(data, self.channels if channels is None else channels,
+                         self.freq if freq is None else freq, self.t0 if t0 is None else t0, self.meta)
+
+    @property
+    def n_samples(self):
+        return self.data.shape[0]
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.data, dtype=dtype)
+
+    def __repr__(self):
+        return 'Recording({} samples x {}, freq={}, t0={})'.format(
+            self.n_samples, list(self.channels), self.freq, self.t0)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.data[:, self._columns[key]]
+        if isinstance(key, slice):
+            start, _, step = key.indices(self.n_samples)
+            freq = self.freq if step == 1 else self.freq / step
+            return self._new(self.data[key], freq=freq, t0=self.t0 + start / self.freq)
+        if isinstance(key, (list, tuple)):
+            return self.select(key)
+        raise TypeError('Index a recording with a channel name, list of channel names or slice of samples')
+
+    def select(self, channels):
+        """
+        Select channels. Adjacent channels in column order are a view of the data, other selections are copied.
+
+        :param channels: channel names
+        :type channels: list
+        :return: recording
+        :rtype: Recording
+        """
+        cols = [self._columns[k] for k in channels]
+        if cols and cols == list(range(cols[0], cols[0] + len(cols))):
+            data = self.data[:, cols[0] : cols[0] + len(cols)]
+        else:
+            data = self.data[:, cols]
+        return self._new(data, channels=channels)
+
+    def time(self, start=None, stop=None):
+        """
+        Calculate time (sec) of a range of samples, without storing the time of every sample.
+
+        :param start: first sample, start of recording if None
+        :type start: int
+        :param stop: sample after the last sample, end of recording if None
+        :type stop: int
+        :return: time (sec)
+        :rtype: ndarray
+        """
+        start, stop, _ = slice(start, stop).indices(self.n_samples)
+        return self.t0 + np.arange(start, stop) / self.freq
+
+    def index(self, time):
+        """
+        Find the nearest sample of a time (sec).
+
+        :param time: time (sec)
+        :type time: float
+        :return: sample index
+        :rtype: int
+        """
+        return int(round((time - self.t0) * self.freq))
+
+    def between(self, start=None, stop=None):
+        """
+        Select a range of time, as a view of the data.
+
+        :param start: start time (sec), start of recording if None
+        :type start: float
+        :param stop: stop time (sec), end of recording if None
+        :type stop: float
+        :return: recording
+        :rtype: Recording
+        """
+        start = None if start is None else max(self.index(start), 0)
+        stop = None if stop is None else max(self.index(stop), 0)
+        return self[start:stop]
+
+    def calibrate(self, channel, scale, offset=0):
+        """
+        Remove offset and calibrate raw voltage of a channel to meaningful values, in place.
+        Views of the recording (eg. slices) share the calibrated values.
+
+        :param channel: channel name
+        :type channel: str
+        :param scale: calibration scale
+        :type scale: float
+        :param offset: calibration offset
+        :type offset: float
+        :return: recording
+        :rtype: Recording
+        """
+        column = self.data[:, self._columns[channel]]
+        column -= offset
+        column *= scale
+        return self
+
+    def to_dict(self):
+        """
+        Convert to a dictionary of channel keys and column views, as returned by read_data.
+
+        :return: dictionary of channel keys and values
+        :rtype: dict
+        """
+        return {k: self.data[:, i] for i, k in enumerate(self.channels)}
+
+
+def accepts_recording(func):
+    """
+    Decorate a processing function so that it also accepts a Recording as its data.
+    All channels are processed along the axis of samples. If the function has a sampling rate
+    argument that is not given, the sampling rate of the recording is used.
+    Results with the same shape as the data are returned as a Recording.
+
+    :param func: processing function
+    :type func: function
+    :return: processing function
+    :rtype: function
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(data, *args, **kwargs):
+        if not isinstance(data, Recording):
+            return func(data, *args, **kwargs)
+        bound = signature.bind_partial(data, *args, **kwargs)
+        if 'freq' in signature.parameters and 'freq' not in bound.arguments:
+            kwargs['freq'] = data.freq
+        if isinstance(kwargs.get('out'), Recording):
+            kwargs['out'] = kwargs['out'].data
+        result = func(data.data, *args, **kwargs)
+        if isinstance(result, np.ndarray) and result.shape == data.data.shape:
+            return data._new(result)
+        return result
+
+    return wrapper
@@ -1,5 +1,11 @@
 import numpy as np
-from numpy import trapz
+from scipy import signal
+try:
+    from numpy import trapezoid as trapz
+except ImportError:
+    from numpy import trapz
+
+from biosig.memo import memoize
 
 
 def find_index_fband(f, lowpass, band_ll, band_ul):
@@ -51,7 +57,7 @@ def find_index_fband(f, lowpass, band_ll, band_ul):
     return start_idx, start_val, stop_idx, stop_val
 
 
-def calc_percentpower(Pxx_den, start_idx, stop_idx):
+def calc_percentpower(Pxx_den, start_idx, stop_idx, verbose=True):
     """
     Calculate proportion of spectral power in a recorded signal over a nominated frequency bandwidth.
     This function requires a power spectral density analysis is first performed on the recorded signal.
@@ -74,33 +80,548 @@ def calc_percentpower(Pxx_den, start_idx, stop_idx):
     :type start_idx: int
     :param stop_idx: stop index
     :type stop_idx: int
+    :param verbose: print proportion of power
+    :type verbose: bool
     :return: percent of power
     :rtype: float
     """
     area_full = trapz(Pxx_den, dx=1)
     area_band = trapz(Pxx_den[start_idx: stop_idx], dx=1)
     percentpower = area_band / area_full * 100
-    print('Proportion of power in bandwidth (%): {:.3f}'.format(percentpower))
+    if verbose:
+        print('Proportion of power in bandwidth (%): {:.3f}'.format(percentpower))
     return percentpower
 
 
-def find_index_digital(array, value):
+def find_index_fbands(f, bands, lowpass=None):
+    """
+    Find the start and stop indices of several nominated frequency bandwidths at once.
+    As for find_index_fband, each limit is matched to the nearest sample frequency.
+    Sample frequencies must be in increasing order, as returned by a power spectral density analysis.
+
+    Example:
+        bands = [(8, 12), (13, 30), (30, 60)]
+        start_idx, stop_idx = find_index_fbands(f, bands)
+
+    :param f: sample frequencies (Hz)
+    :type f: ndarray
+    :param bands: lower and upper limits of each bandwidth (Hz)
+    :type bands: list
+    :param lowpass: low pass cut-off (Hz), limits must not be greater if specified
+    :type lowpass: int
+    :return: start and stop indices
+    :rtype: ndarray
+    """
+    f = np.asarray(f)
+    limits = np.asarray(bands, dtype=np.float64).reshape(-1, 2)
+    if lowpass is not None:
+        assert (limits <= lowpass).all(), 'Error: The nominated frequency is greater than the low pass cut-off'
+    # Nearest sample frequency is either side of the insertion point.
+    idx = np.clip(np.searchsorted(f, limits), 1, f.size - 1)
+    idx -= (limits - f[idx - 1]) <= (f[idx] - limits)
+    return idx[:, 0], idx[:, 1]
+
+
+@memoize
+def calc_bandpower(f, Pxx_den, bands, lowpass=None, axis=-1, verbose=False):
+    """
+    Calculate absolute and percent spectral power in several nominated frequency bandwidths,
+    for one or many power spectra at once (eg. one spectrum per window or channel).
+    The spectrum is integrated once (cumulative trapezoid), and the power in each band is
+    the difference of the integral at the band limits. Band limits are found as in find_index_fbands,
+    and percent power matches calc_percentpower for each band.
+
+    Example:
+        f, Pxx_den = signal.welch(windows, 2000, nperseg=256, axis=-1)
+        power, percentpower = calc_bandpower(f, Pxx_den, [(8, 12), (13, 30), (30, 60)])
+
+    :param f: sample frequencies (Hz)
+    :type f: ndarray
+    :param Pxx_den: power spectral density or power spectrum, spectra x frequencies
+    :type Pxx_den: ndarray
+    :param bands: lower and upper limits of each bandwidth (Hz)
+    :type bands: list
+    :param lowpass: low pass cut-off (Hz), limits must not be greater if specified
+    :type lowpass: int
+    :param axis: axis of frequencies
+    :type axis: int
+    :param verbose: print proportion of power in each bandwidth
+    :type verbose: bool
+    :return: absolute power and percent of power, spectra x bands
+    :rtype: ndarray
+    """
+    f = np.asarray(f, dtype=np.float64)
+    Pxx_den = np.moveaxis(np.asarray(Pxx_den, dtype=np.float64), axis, -1)
+    start_idx, stop_idx = find_index_fbands(f, bands, lowpass)
+    # Cumulative trapezoid, area[..., k] is the integral from f[0] to f[k].
+    steps = (Pxx_den[..., 1:] + Pxx_den[..., :-1]) / 2 * np.diff(f)
+    area = np.concatenate((np.zeros(Pxx_den.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)), axis=-1)
+    # Band integrates Pxx_den[start_idx:stop_idx], ie. up to f[stop_idx - 1].
+    stop_area = np.maximum(stop_idx - 1, start_idx)
+    power = area[..., stop_area] - area[..., start_idx]
+    percentpower = power / area[..., -1:] * 100
+    if verbose:
+        for band, percent in zip(bands, np.moveaxis(percentpower, -1, 0)):
+            print('Proportion of power in bandwidth {}-{} Hz (%): {}'.format(
+                band[0], band[1], np.array2string(np.asarray(percent), precision=3)))
+    return power, percentpower
+
+
+def _per_channel(func, array, axis, *args):
+    """
+    Apply a function that finds indices in a 1D array to each channel of an nD array.
+    """
+    array = np.asarray(array)
+    if array.ndim == 1:
+        return func(array, *args)
+    array = np.moveaxis(array, axis, 0)
+    array = array.reshape(array.shape[0], -1)
+    results = [func(array[:, i], *args) for i in range(array.shape[1])]
+    return tuple(list(result) for result in zip(*results))
+
+
+def _find_edges(array, value):
+    diff = np.diff(array)
+    start_idx = np.flatnonzero(diff == value) + 1
+    stop_idx = np.flatnonzero(diff == -value) + 1
+    return start_idx, stop_idx
+
+
+def find_index_digital(array, value, axis=0):
     """
     Find indices when a digital signal changes from LOW to HIGH, and HIGH to LOW.
+    A signal that is HIGH at the first sample does not have a change at index 0.
 
-    :param array: 1D array of digital output eg. 0 and 1
+    Example:
+        start_idx, stop_idx = find_index_digital(trigger, 1)
+        # several digital channels, samples x channels
+        start_idxs, stop_idxs = find_index_digital(triggers, 1)
+
+    :param array: 1D array of digital output eg. 0 and 1, or nD array of several digital channels
     :type array: ndarray
     :param value: HIGH value eg. 1
     :type value: int
-    :return: start and stop indices
-    :rtype: list
-    """
-    start_idx, stop_idx = [], []
-    for i in range(array.size):
-        if array[i] - array[i - 1] == value:
-            start_idx.append(i)
-        if array[i] - array[i - 1] == -value:
-            stop_idx.append(i)
+    :param axis: axis of samples
+    :type axis: int
+    :return: start and stop indices, or lists of start and stop indices for each channel
+    :rtype: ndarray or list
+    """
+    return _per_channel(_find_edges, array, axis, value)
+
+
+def _digitise(array, value, threshold):
+    """
+    Convert a signal to boolean HIGH and LOW states.
+    A tuple threshold (low, high) applies hysteresis: the state changes to HIGH
+    above the high threshold and to LOW below the low threshold.
+    """
+    if threshold is None:
+        return array == value
+    if np.ndim(threshold) == 0:
+        return array > threshold
+    low, high = threshold
+    event = np.full(array.shape, -1, dtype=np.int8)
+    event[array > high] = 1
+    event[array < low] = 0
+    # Carry the last HIGH or LOW event forward over samples between thresholds.
+    last = np.where(event >= 0, np.arange(array.size), 0)
+    np.maximum.accumulate(last, out=last)
+    return event[last] == 1
+
+
+def _find_pulses(array, value, threshold, min_width, min_gap):
+    state = _digitise(array, value, threshold).view(np.int8)
+    diff = np.diff(state)
+    start_idx = np.flatnonzero(diff == 1) + 1
+    stop_idx = np.flatnonzero(diff == -1) + 1
+    # Keep complete pulses only: drop a stop before the first start and a start without a stop.
+    if stop_idx.size and (not start_idx.size or stop_idx[0] < start_idx[0]):
+        stop_idx = stop_idx[1:]
+    start_idx = start_idx[:stop_idx.size]
+    if min_gap and start_idx.size > 1:
+        # Merge pulses separated by short LOW glitches.
+        keep = start_idx[1:] - stop_idx[:-1] >= min_gap
+        start_idx = start_idx[np.concatenate(([True], keep))]
+        stop_idx = stop_idx[np.concatenate((keep, [True]))]
+    if min_width:
+        keep = stop_idx - start_idx >= min_width
+        start_idx, stop_idx = start_idx[keep], stop_idx[keep]
     return start_idx, stop_idx
 
 
+def find_pulses(array, value=1, threshold=None, min_width=0, min_gap=0, axis=0):
+    """
+    Find paired start (LOW to HIGH) and stop (HIGH to LOW) indices of pulses in a digital signal.
+    Only complete pulses are returned, so start and stop indices have equal length and
+    stop_idx[i] is the first LOW sample after start_idx[i].
+
+    Digital signals are HIGH when equal to value. For analog TTL signals, nominate a threshold:
+    a number, or a tuple (low, high) for hysteresis between two thresholds.
+    Pulses can be debounced by merging pulses separated by fewer than min_gap LOW samples
+    and then dropping pulses shorter than min_width samples.
+
+    Example:
+        start_idx, stop_idx = find_pulses(trigger, 1, min_width=10)
+        start_idx, stop_idx = find_pulses(ttl, threshold=(0.8, 2.0))
+
+    :param array: 1D array of digital or analog TTL output, or nD array of several channels
+    :type array: ndarray
+    :param value: HIGH value eg. 1
+    :type value: int
+    :param threshold: threshold, or tuple of low and high thresholds (eg. V)
+    :type threshold: float or tuple
+    :param min_width: minimum pulse width (samples)
+    :type min_width: int
+    :param min_gap: minimum gap between pulses (samples)
+    :type min_gap: int
+    :param axis: axis of samples
+    :type axis: int
+    :return: start and stop indices, or lists of start and stop indices for each channel
+    :rtype: ndarray or list
+    """
+    return _per_channel(_find_pulses, array, axis, value, threshold, min_width, min_gap)
+
+
+@memoize
+def calc_stft(data, freq, window=500, step=250, nfft=None, window_type='hann', axis=0):
+    """
+    Calculate the power spectral density of a recorded signal (usually EMG) over short windows of time.
+    All windows are taken as a strided view of the signal and transformed with a single FFT,
+    with the mean of each window removed. Density is one-sided and scaled as for scipy.signal.spectrogram.
+    Output can be plotted with plot_spectrogram (one channel at a time) or reduced
+    with calc_median_frequency, calc_mean_frequency and calc_bandpower (axis=-2).
+
+    Example:
+        f, t, Sxx = calc_stft(emg_filt, freq=2000, window=500, step=250)
+        plot_spectrogram(f, t, Sxx, ylim_ul=500, xmargin=30, toffset=30)
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param step: time between the start of consecutive windows (ms)
+    :type step: int
+    :param nfft: length of FFT, window length if None
+    :type nfft: int
+    :param window_type: taper applied to each window (see scipy.signal.get_window)
+    :type window_type: str
+    :param axis: axis of samples
+    :type axis: int
+    :return: sample frequencies, time at the centre of each window (sec), and power spectral density
+             with frequencies on the second last and windows on the last axis (eg. channels x frequencies x windows)
+    :rtype: ndarray
+    """
+    x = np.moveaxis(np.asarray(data, dtype=np.float64), axis, -1)
+    nperseg, nstep, nfft, taper = _stft_setup(freq, window, step, nfft, window_type)
+    if nperseg > x.shape[-1]:
+        raise ValueError('Window of {} samples does not fit in {} samples'.format(nperseg, x.shape[-1]))
+    f = np.fft.rfftfreq(nfft, 1 / freq)
+    Sxx = _stft_frames(x, freq, nperseg, nstep, nfft, taper)
+    t = (np.arange(Sxx.shape[-1]) * nstep + nperseg / 2) / freq
+    return f, t, Sxx
+
+
+def _stft_setup(freq, window, step, nfft, window_type):
+    """
+    Window length, step and FFT length (samples) and taper of a short-time spectrum.
+    """
+    nperseg = int(round(window / 1000 * freq))
+    nstep = max(int(round(step / 1000 * freq)), 1)
+    if nperseg < 2:
+        raise ValueError('Window must be at least 2 samples, got {}'.format(nperseg))
+    nfft = nperseg if nfft is None else nfft
+    return nperseg, nstep, nfft, signal.get_window(window_type, nperseg)
+
+
+def _stft_frames(x, freq, nperseg, nstep, nfft, taper):
+    """
+    Power spectral density of all full windows of x (samples on the last axis), frequencies x windows.
+    """
+    # Windows x samples view of each channel, without copying.
+    frames = np.lib.stride_tricks.sliding_window_view(x, nperseg, axis=-1)[..., ::nstep, :]
+    frames = (frames - frames.mean(axis=-1, keepdims=True)) * taper
+    Sxx = np.abs(np.fft.rfft(frames, n=nfft, axis=-1)) ** 2 / (freq * np.sum(taper ** 2))
+    # One-sided density: double all but the zero and Nyquist frequencies.
+    Sxx[..., 1 : (nfft + 1) // 2] *= 2
+    return np.swapaxes(Sxx, -1, -2)
+
+
+def iter_stft(chunks, freq, window=500, step=250, nfft=None, window_type='hann', axis=0):
+    """
+    Calculate short-time power spectral density (as calc_stft) of a recorded signal that is read in blocks (chunks),
+    eg. with iter_array, so that memory does not depend on the length of the recording.
+    Samples of a window that spans two blocks are carried over to the next block.
+
+    Example:
+        for f, t, Sxx in iter_stft(iter_array('V_L.txt', [1]), freq=2000):
+            ...
+
+    :param chunks: blocks of data
+    :type chunks: iterable
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param step: time between the start of consecutive windows (ms)
+    :type step: int
+    :param nfft: length of FFT, window length if None
+    :type nfft: int
+    :param window_type: taper applied to each window (see scipy.signal.get_window)
+    :type window_type: str
+    :param axis: axis of samples in each block
+    :type axis: int
+    :return: sample frequencies, time at the centre of each window (sec) and power spectral density
+             of windows completed by each block
+    :rtype: generator
+    """
+    nperseg, nstep, nfft, taper = _stft_setup(freq, window, step, nfft, window_type)
+    f = np.fft.rfftfreq(nfft, 1 / freq)
+    buffer = None
+    start = 0
+    for chunk in chunks:
+        x = np.moveaxis(np.asarray(chunk, dtype=np.float64), axis, -1)
+        x = x if buffer is None else np.concatenate((buffer, x), axis=-1)
+        n_frames = (x.shape[-1] - nperseg) // nstep + 1 if x.shape[-1] >= nperseg else 0
+        if n_frames:
+            Sxx = _stft_frames(x, freq, nperseg, nstep, nfft, taper)
+            t = (start + np.arange(n_frames) * nstep + nperseg / 2) / freq
+            yield f, t, Sxx
+        # Keep samples from the start of the next window.
+        buffer = x[..., n_frames * nstep:]
+        start += n_frames * nstep
+
+
+def _bin_edges(n, n_bins):
+    """
+    Start index of each of n_bins nearly equal bins of n items (at most n bins).
+    """
+    return np.unique(np.linspace(0, n, min(n_bins, n) + 1).astype(np.int64)[:-1])
+
+
+def _reduce_rows(f, Sxx, n_rows, fmax):
+    """
+    Crop frequencies to fmax and average adjacent frequencies down to n_rows.
+    """
+    if fmax is not None:
+        keep = f <= fmax
+        f, Sxx = f[keep], Sxx[..., keep, :]
+    if n_rows is not None and f.size > n_rows:
+        edges = _bin_edges(f.size, n_rows)
+        counts = np.diff(np.append(edges, f.size))
+        f = np.add.reduceat(f, edges) / counts
+        Sxx = np.add.reduceat(Sxx, edges, axis=-2) / counts[:, np.newaxis]
+    return f, Sxx
+
+
+def reduce_spectrogram(f, t, Sxx, n_columns=None, n_rows=None, fmax=None):
+    """
+    Reduce a spectrogram to a display resolution, by averaging power over bins of adjacent windows (columns)
+    and frequencies (rows). Frequencies above fmax are dropped first.
+
+    :param f: sample frequencies
+    :type f: ndarray
+    :param t: segment times
+    :type t: ndarray
+    :param Sxx: spectrogram, with frequencies on the second last and segment times on the last axis
+    :type Sxx: ndarray
+    :param n_columns: maximum number of columns (eg. width of plot in pixels), all columns if None
+    :type n_columns: int
+    :param n_rows: maximum number of rows, all rows if None
+    :type n_rows: int
+    :param fmax: highest frequency kept (Hz), all frequencies if None
+    :type fmax: float
+    :return: sample frequencies, segment times and spectrogram, averaged over each bin
+    :rtype: ndarray
+    """
+    f, Sxx = _reduce_rows(np.asarray(f, dtype=np.float64), np.asarray(Sxx, dtype=np.float64), n_rows, fmax)
+    t = np.asarray(t, dtype=np.float64)
+    if n_columns is not None and t.size > n_columns:
+        edges = _bin_edges(t.size, n_columns)
+        counts = np.diff(np.append(edges, t.size))
+        t = np.add.reduceat(t, edges) / counts
+        Sxx = np.add.reduceat(Sxx, edges, axis=-1) / counts
+    return f, t, Sxx
+
+
+def calc_spectrogram(data, freq, window=500, step=250, n_columns=None, n_rows=None, fmax=None,
+                     n_samples=None, chunksize=65536, nfft=None, window_type='hann', axis=0):
+    """
+    Calculate the spectrogram of a long recording in blocks of samples, averaged to a display resolution
+    as it is calculated (see reduce_spectrogram), so that peak memory depends on the block size and
+    the display resolution but not on the length of the recording.
+    The recording can be an array (eg. a memory-mapped .npy file or a Recording) or an iterable of blocks
+    (eg. from iter_array), in which case the number of samples must be given to average to n_columns.
+    Output can be plotted with plot_spectrogram (one channel at a time).
+
+    Example:
+        data = np.load('V_L.npy', mmap_mode='r')
+        f, t, Sxx = calc_spectrogram(data[:, 1], freq=10000, n_columns=2000, fmax=500)
+        plot_spectrogram(f, t, Sxx, ylim_ul=500, xmargin=1800, toffset=1800)
+
+    :param data: data, or iterable of blocks of data
+    :type data: ndarray or iterable
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param step: time between the start of consecutive windows (ms)
+    :type step: int
+    :param n_columns: maximum number of columns (eg. width of plot in pixels), all windows if None
+    :type n_columns: int
+    :param n_rows: maximum number of rows, all frequencies if None
+    :type n_rows: int
+    :param fmax: highest frequency kept (Hz), all frequencies if None
+    :type fmax: float
+    :param n_samples: number of samples of an iterable of blocks
+    :type n_samples: int
+    :param chunksize: number of samples in each block of an array
+    :type chunksize: int
+    :param nfft: length of FFT, window length if None
+    :type nfft: int
+    :param window_type: taper applied to each window (see scipy.signal.get_window)
+    :type window_type: str
+    :param axis: axis of samples
+    :type axis: int
+    :return: sample frequencies, segment times and spectrogram
+    :rtype: ndarray
+    """
+    if hasattr(data, 'shape') or hasattr(data, '__array__'):
+        data = np.moveaxis(data if hasattr(data, 'shape') else np.asarray(data), axis, 0)
+        n_samples = data.shape[0]
+        chunks = (data[i : i + chunksize] for i in range(0, n_samples, chunksize))
+        axis = 0
+    else:
+        chunks = data
+    nperseg, nstep, _, _ = _stft_setup(freq, window, step, nfft, window_type)
+    if n_columns is None:
+        blocks = [_reduce_rows(f, Sxx, n_rows, fmax) + (t,)
+                  for f, t, Sxx in iter_stft(chunks, freq, window, step, nfft, window_type, axis)]
+        if not blocks:
+            raise ValueError('Window of {} samples does not fit in the recording'.format(nperseg))
+        return blocks[0][0], np.concatenate([b[2] for b in blocks]), np.concatenate([b[1] for b in blocks], axis=-1)
+    if n_samples is None:
+        raise ValueError('Number of samples must be given to reduce blocks of data to n_columns')
+    n_frames = (n_samples - nperseg) // nstep + 1
+    if n_frames < 1:
+        raise ValueError('Window of {} samples does not fit in {} samples'.format(nperseg, n_samples))
+    edges = _bin_edges(n_frames, n_columns)
+    counts = np.diff(np.append(edges, n_frames))
+    t_sum = np.zeros(edges.size)
+    total = None
+    first = 0
+    for f, t, Sxx in iter_stft(chunks, freq, window, step, nfft, window_type, axis):
+        f, Sxx = _reduce_rows(f, Sxx, n_rows, fmax)
+        if total is None:
+            total = np.zeros(Sxx.shape[:-1] + (edges.size,))
+        # Column of each window, and the first window of each column in this block.
+        column = np.searchsorted(edges, np.arange(first, first + t.size), side='right') - 1
+        columns, starts = np.unique(column, return_index=True)
+        total[..., columns] += np.add.reduceat(Sxx, starts, axis=-1)
+        t_sum[columns] += np.add.reduceat(t, starts)
+        first += t.size
+    return f, t_sum / counts, total / counts
+
+
+def _limit_fband(f, Pxx_den, axis, fband):
+    """
+    Move frequencies to the last axis of spectra, and keep only frequencies within fband.
+    """
+    Pxx_den = np.moveaxis(np.asarray(Pxx_den, dtype=np.float64), axis, -1)
+    f = np.asarray(f, dtype=np.float64)
+    if fband is not None:
+        keep = (f >= fband[0]) & (f <= fband[1])
+        f, Pxx_den = f[keep], Pxx_den[..., keep]
+    return f, Pxx_den
+
+
+def calc_median_frequency(f, Pxx_den, axis=-1, fband=None):
+    """
+    Calculate the median frequency of power spectra: the frequency that divides spectral power into two equal halves.
+    Median frequency of EMG falls with muscle fatigue.
+
+    Example:
+        f, t, Sxx = calc_stft(emg_filt, freq=2000)
+        mdf = calc_median_frequency(f, Sxx, axis=-2, fband=(30, 500))
+
+    :param f: sample frequencies
+    :type f: ndarray
+    :param Pxx_den: power spectral density or power spectrum
+    :type Pxx_den: ndarray
+    :param axis: axis of frequencies
+    :type axis: int
+    :param fband: lower and upper limits of frequencies included (Hz), all frequencies if None
+    :type fband: tuple
+    :return: median frequency of each spectrum (Hz)
+    :rtype: ndarray
+    """
+    f, Pxx_den = _limit_fband(f, Pxx_den, axis, fband)
+    cumpower = np.cumsum(Pxx_den, axis=-1)
+    half = cumpower[..., -1:] / 2
+    idx = np.minimum(np.sum(cumpower < half, axis=-1, keepdims=True), f.size - 1)
+    # Each sample frequency holds the power of a bin of width df centred on it;
+    # interpolate within the bin where cumulative power reaches half.
+    power = np.take_along_axis(Pxx_den, idx, axis=-1)
+    below = np.take_along_axis(cumpower, idx, axis=-1) - power
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(power > 0, (half - below) / power, 0.5)
+    df = f[1] - f[0] if f.size > 1 else 0
+    return np.squeeze(f[idx] + (frac - 0.5) * df, axis=-1)
+
+
+def calc_mean_frequency(f, Pxx_den, axis=-1, fband=None):
+    """
+    Calculate the mean frequency of power spectra: the power-weighted average of frequencies.
+
+    :param f: sample frequencies
+    :type f: ndarray
+    :param Pxx_den: power spectral density or power spectrum
+    :type Pxx_den: ndarray
+    :param axis: axis of frequencies
+    :type axis: int
+    :param fband: lower and upper limits of frequencies included (Hz), all frequencies if None
+    :type fband: tuple
+    :return: mean frequency of each spectrum (Hz)
+    :rtype: ndarray
+    """
+    f, Pxx_den = _limit_fband(f, Pxx_den, axis, fband)
+    return np.sum(Pxx_den * f, axis=-1) / np.sum(Pxx_den, axis=-1)
+
+
+@memoize
+def calc_fatigue(data, freq, window=500, step=250, bands=None, fband=None, axis=0):
+    """
+    Track the spectrum of a recorded signal (usually EMG) over a long contraction:
+    median frequency, mean frequency and, if bands are nominated, band power of short windows of time (see calc_stft).
+
+    Example:
+        t, mdf, mnf, power = calc_fatigue(emg_filt, freq=2000, window=500, step=250,
+                                          bands=[(30, 80), (80, 250)], fband=(30, 500))
+        # samples x channels
+        t, mdf, mnf, _ = calc_fatigue(emgs, freq=2000)
+        mdf_slope = np.polyfit(t, mdf.T, 1)[0]
+
+    :param data: data
+    :type data: ndarray
+    :param freq: sampling rate (Hz)
+    :type freq: int
+    :param window: window of time (ms)
+    :type window: int
+    :param step: time between the start of consecutive windows (ms)
+    :type step: int
+    :param bands: lower and upper limits of each bandwidth (Hz)
+    :type bands: list
+    :param fband: lower and upper limits of frequencies included in median and mean frequency (Hz)
+    :type fband: tuple
+    :param axis: axis of samples
+    :type axis: int
+    :return: time at the centre of each window (sec), median and mean frequency of each window (Hz),
+             and absolute power of each window in each band (windows x bands), None if no bands
+    :rtype: ndarray
+    """
+    f, t, Sxx = calc_stft(data, freq, window, step, axis=axis)
+    mdf = calc_median_frequency(f, Sxx, axis=-2, fband=fband)
+    mnf = calc_mean_frequency(f, Sxx, axis=-2, fband=fband)
+    power = calc_bandpower(f, Sxx, bands, axis=-2)[0] if bands else None
+    return t, mdf, mnf, power
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from biosig.readin import ContainerReader, ContainerWriter, convert_text, read_container, read_data
+
+
+LOG = """subject number 07
+transducer 1 calibration: 12.5
+transducer 2 calibration: 0.8
+sampling rate: 2000
+age: 31
+sex: F
+height: 1.68
+weight: 61.0
+"""
+
+
+@pytest.fixture
+def recording(tmp_path):
+    data = np.round(np.random.default_rng(0).standard_normal((5003, 3)), 6)
+    file = tmp_path / 'V_L.txt'
+    np.savetxt(file, data, delimiter='\t', fmt='%.6f')
+    log = tmp_path / 'log.txt'
+    log.write_text(LOG)
+    return data, str(file), str(log)
+
+
+def test_convert_round_trip(recording, tmp_path):
+    data, file, log = recording
+    channels = {'force': 0, 'emg': 1, 'distance': 2}
+    file_out = str(tmp_path / 'V_L.bsig')
+    convert_text(file, file_out, channels, log=log, chunksize=1000)
+    result, freq, meta = read_container(file_out)
+    assert freq == 2000
+    assert meta['id'] == '07' and meta['scale1'] == 12.5 and meta['sex'] == 'F'
+    assert list(result) == list(channels)
+    text = read_data(file, channels)
+    for k, col in channels.items():
+        np.testing.assert_array_equal(result[k], data[:, col])
+        np.testing.assert_array_equal(result[k], text[k])
+
+
+@pytest.mark.parametrize('start, stop', [(0, 1000), (999, 1001), (1500, 3700), (4990, 5003), (4000, 9999), (2500, 2500)])
+def test_partial_chunk_ranges(recording, tmp_path, start, stop):
+    data, file, log = recording
+    file_out = str(tmp_path / 'V_L.bsig')
+    convert_text(file, file_out, {'force': 0, 'emg': 1, 'distance': 2}, freq=2000, chunksize=1000)
+    with ContainerReader(file_out) as reader:
+        samples = reader.read_samples(start, stop, channels=['distance', 'force'])
+        np.testing.assert_array_equal(samples['distance'], data[start:stop, 2])
+        np.testing.assert_array_equal(samples['force'], data[start:stop, 0])
+        times = reader.read(start / 2000, stop / 2000, channels=['emg'])
+        np.testing.assert_array_equal(times['emg'], data[start:stop, 1])
+
+
+def test_writer_blocks_and_dtype(tmp_path):
+    data = np.random.default_rng(1).standard_normal((2500, 2)).astype(np.float32)
+    file_out = str(tmp_path / 'blocks.bsig')
+    with ContainerWriter(file_out, ['a', 'b'], freq=1000, chunksize=512, dtype=np.float32) as writer:
+        for i in range(0, 2500, 333):
+            writer.write(data[i : i + 333])
+    result, freq, meta = read_container(file_out, start=0.4, stop=1.7)
+    assert result['a'].dtype == np.float32
+    np.testing.assert_array_equal(result['b'], data[400:1700, 1])
+
+
+def test_failed_write_leaves_no_container(tmp_path):
+    file_out = str(tmp_path / 'failed.bsig')
+    with pytest.raises(RuntimeError):
+        with ContainerWriter(file_out, ['a'], freq=1000, chunksize=10) as writer:
+            writer.write(np.arange(25.0))
+            raise RuntimeError('acquisition stopped')
+    assert not os.path.exists(file_out)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from biosig.filters import design_butter, filter_into
+from biosig.emg.process import filter_bandpass, filter_bandpass_chunks
+from biosig.force.process import filter_lowpass, filter_lowpass_chunks
+
+
+def split(data, chunksize, axis=0):
+    n = data.shape[axis]
+    return [np.take(data, np.arange(i, min(i + chunksize, n)), axis=axis) for i in range(0, n, chunksize)]
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).standard_normal((5000, 2)).cumsum(axis=0)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 4999])
+@pytest.mark.parametrize('axis', [0, 1])
+def test_chunks_match_full_signal(data, chunksize, axis):
+    data = data if axis == 0 else data.T
+    chunks = filter_bandpass_chunks(split(data, chunksize, axis), 2000, axis=axis)
+    expected = signal.sosfiltfilt(design_butter(4, 2000, (30, 500), 'bandpass'), data, axis=axis)
+    np.testing.assert_allclose(np.concatenate(list(chunks), axis=axis), expected, atol=1e-8)
+    chunks = filter_lowpass_chunks(split(data, chunksize, axis), 2000, axis=axis)
+    expected = signal.sosfiltfilt(design_butter(4, 2000, 30, 'low'), data, axis=axis)
+    np.testing.assert_allclose(np.concatenate(list(chunks), axis=axis), expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 4999])
+def test_causal_chunks_match_sosfilt(data, chunksize):
+    sos = design_butter(4, 2000, (30, 500), 'bandpass')
+    chunks = filter_bandpass_chunks(split(data, chunksize), 2000, zero_phase=False)
+    expected, _ = signal.sosfilt(sos, data, axis=0, zi=signal.sosfilt_zi(sos)[..., np.newaxis] * data[0])
+    np.testing.assert_allclose(np.concatenate(list(chunks)), expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('n', [10, 40])
+def test_short_signal(n):
+    data = np.random.default_rng(n).standard_normal(n)
+    sos = design_butter(4, 2000, 30, 'low')
+    chunks = list(filter_lowpass_chunks(split(data, 3), 2000))
+    # Signals no longer than the padding of sosfiltfilt (15 samples) are padded by n - 1 samples.
+    expected = signal.sosfiltfilt(sos, data, padlen=n - 1 if n <= 15 else None)
+    np.testing.assert_allclose(np.concatenate(chunks), expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('blocksize', [7, 100, 4999, 65536])
+def test_filter_into(data, blocksize):
+    sos = design_butter(4, 2000, (30, 500), 'bandpass')
+    out = np.empty_like(data)
+    filter_into(sos, data, out, blocksize=blocksize)
+    np.testing.assert_allclose(out, signal.sosfiltfilt(sos, data, axis=0), atol=1e-8)
+
+
+def test_filter_out_and_dtype(data):
+    expected = signal.sosfiltfilt(design_butter(4, 2000, (30, 500), 'bandpass'), data, axis=0)
+    out = np.empty_like(data)
+    assert filter_bandpass(data, 2000, out=out) is out
+    np.testing.assert_allclose(out, expected, atol=1e-8)
+    result = filter_bandpass(data, 2000, dtype=np.float32)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-4)
+    in_place = data.copy()
+    filter_lowpass(in_place, 2000, out=in_place)
+    np.testing.assert_allclose(in_place, signal.sosfiltfilt(design_butter(4, 2000, 30, 'low'), data, axis=0), atol=1e-8)
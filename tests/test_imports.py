@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(statement):
+    """
+    Run an import in a fresh interpreter and return the names of loaded modules.
+    """
+    code = '{}\nimport sys\nprint("\\n".join(sys.modules))'.format(statement)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize('statement', [
+    'import biosig.emg.process',
+    'import biosig.force.process',
+    'import biosig',
+])
+def test_import_does_not_load_matplotlib(statement):
+    modules = loaded_modules(statement)
+    assert 'biosig' in modules
+    assert not any(name == 'matplotlib' or name.startswith('matplotlib.') for name in modules)
+
+
+def test_plot_function_loads_matplotlib():
+    modules = loaded_modules('import biosig\nbiosig.plot_trace')
+    assert 'matplotlib' in modules
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from biosig.emg.process import calc_halfwidth, calc_rms, calc_mean
+
+
+def loop_rms(data, freq, window):
+    """
+    Moving RMS as originally calculated sample by sample, with the last sample filled.
+    """
+    halfwidth = calc_halfwidth(freq, window)
+    data_rms = np.zeros(data.size)
+    for i in range(data.size - 1):
+        if i < halfwidth:
+            data_rms[i] = np.sqrt(np.mean((data[0 : i + halfwidth]) ** 2))
+        elif i > data.size - halfwidth:
+            data_rms[i] = np.sqrt(np.mean((data[i - halfwidth : data.size - 1]) ** 2))
+        else:
+            data_rms[i] = np.sqrt(np.mean((data[i - halfwidth : i + halfwidth]) ** 2))
+    data_rms[-1] = np.sqrt(np.mean((data[data.size - 1 - halfwidth :]) ** 2))
+    return data_rms
+
+
+def loop_mean(data, mvc, freq, window):
+    """
+    Moving mean as originally calculated sample by sample, with the last sample filled.
+    """
+    halfwidth = calc_halfwidth(freq, window)
+    data_mean = np.zeros(data.size)
+    for i in range(data.size - 1):
+        if i < halfwidth:
+            data_mean[i] = np.mean(data[0 : i + halfwidth]) / mvc * 100
+        elif i > data.size - halfwidth:
+            data_mean[i] = np.mean(data[i - halfwidth : data.size - 1]) / mvc * 100
+        else:
+            data_mean[i] = np.mean(data[i - halfwidth : i + halfwidth]) / mvc * 100
+    data_mean[-1] = np.mean(data[data.size - 1 - halfwidth :]) / mvc * 100
+    return data_mean
+
+
+@pytest.mark.parametrize('n, window', [(2000, 50), (1001, 20), (500, 250), (37, 5), (15, 10), (50, 40)])
+def test_calc_rms_matches_loop(n, window):
+    data = np.random.default_rng(n).standard_normal(n)
+    np.testing.assert_allclose(calc_rms(data, 2000, window), loop_rms(data, 2000, window), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('n, window', [(2000, 50), (1001, 20), (500, 250), (37, 5), (15, 10), (50, 40)])
+def test_calc_mean_matches_loop(n, window):
+    data = np.abs(np.random.default_rng(n).standard_normal(n))
+    np.testing.assert_allclose(calc_mean(data, 0.8, 2000, window), loop_mean(data, 0.8, 2000, window),
+                               rtol=1e-9, atol=1e-12)
+
+
+def test_tail_windows():
+    data = np.arange(1.0, 11.0)
+    # halfwidth 3 samples: windows after sample n - halfwidth stop before the last sample,
+    # except the window of the last sample
+    data_mean = calc_mean(data, 100, 2000, 3)
+    assert data_mean[7] == pytest.approx(np.mean(data[4:10]))
+    assert data_mean[8] == pytest.approx(np.mean(data[5:9]))
+    assert data_mean[9] == pytest.approx(np.mean(data[6:10]))
+
+
+def test_multichannel_axis():
+    data = np.random.default_rng(0).standard_normal((3000, 3))
+    expected = np.column_stack([loop_rms(data[:, i], 2000, 50) for i in range(3)])
+    np.testing.assert_allclose(calc_rms(data, 2000, 50), expected, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(calc_rms(data.T, 2000, 50, axis=1), expected.T, rtol=1e-9, atol=1e-12)
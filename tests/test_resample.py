@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from biosig.force.process import resample
+
+
+@pytest.mark.parametrize('new_freq', [100, 300, 2500])
+def test_resample_amplitude_and_timing(new_freq):
+    freq = 2000
+    time = np.arange(4 * freq) / freq
+    data = 2.0 + np.sin(2 * np.pi * 5 * time)
+    result = resample(data, freq, new_freq)
+    time_new = np.arange(result.size) / new_freq
+    assert result.size == int(np.ceil(data.size * new_freq / freq))
+    # Edges are affected by padding of the filter.
+    edge = new_freq // 2
+    np.testing.assert_allclose(result[edge:-edge], 2.0 + np.sin(2 * np.pi * 5 * time_new[edge:-edge]), atol=2e-3)
+    # A constant signal keeps its amplitude.
+    np.testing.assert_allclose(resample(np.full(data.size, 2.0), freq, new_freq)[edge:-edge], 2.0, atol=1e-3)